@@ -1,9 +1,17 @@
-from config import flush_keys_containing_pattern, flush_all
-from flask import Flask, request
+import flush_jobs
+from flask import Flask, Response, request, jsonify
 import logging
 from processor import producer
-from fetcher import fetch_and_cache
+from fetcher import redis_cache_stats
+from tiered_cache import local_cache
+from registry import controller_registry
+from proxy_health import proxy_tracker
+from pullpush import scrape_latency_stats
+from tag_index import tag_index
+from metrics import metrics
+from tracing import tracer
 import consumer
+import http_client
 import threading
 from proxies import get_fastest_proxies,fetch_proxies
 
@@ -25,11 +33,9 @@ def setup_proxies():
     print(sorted_proxies)
     
 def agents():
-    url = "https://stories-blog.pockethost.io/api/collections/scraper_controllers/records"
-    data = fetch_and_cache(url)
-    if data:
-        for agent in data['items']:
-            producer([agent['id']], 'scraper_consumer')
+    agent_ids = [agent['id'] for agent in controller_registry.all()]
+    if agent_ids:
+        producer(agent_ids, 'scraper_consumer', traces=[tracer.new() for _ in agent_ids])
 
 def run_setup_proxies_in_background():
     proxies_thread = threading.Thread(target=setup_proxies)
@@ -43,8 +49,8 @@ def run_agents_in_background():
 
 @app.route('/flush-keys', methods=['GET'])
 def flush_all_keys():
-    flush_all()
-    return "Flushed all keys"
+    job_id = flush_jobs.start_flush()
+    return jsonify({'job_id': job_id, 'status': f"/flush/status/{job_id}"}), 202
 
 @app.route('/flush', methods=['GET'])
 def flush_keys():
@@ -52,8 +58,15 @@ def flush_keys():
     if not pattern:
         return 'Error: pattern is required', 400
 
-    flush_keys_containing_pattern(pattern)
-    return f"Flushed keys containing the pattern: {pattern}"
+    job_id = flush_jobs.start_flush(pattern)
+    return jsonify({'job_id': job_id, 'pattern': pattern, 'status': f"/flush/status/{job_id}"}), 202
+
+@app.route('/flush/status/<job_id>', methods=['GET'])
+def flush_status(job_id):
+    status = flush_jobs.get_status(job_id)
+    if status is None:
+        return 'Error: unknown flush job', 404
+    return jsonify(status)
 
 @app.route('/setup-proxies', methods=['GET'])
 def setup_proxies_api():
@@ -65,6 +78,28 @@ def scan():
     run_agents_in_background()
     return 'Agents processing started'
 
+@app.route('/stats/http', methods=['GET'])
+def http_stats():
+    return jsonify(http_client.stats())
+
+@app.route('/stats/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({'local': local_cache.stats(), 'redis': redis_cache_stats})
+
+@app.route('/stats/reddit', methods=['GET'])
+def reddit_stats():
+    return jsonify(scrape_latency_stats())
+
+@app.route('/stats/traces', methods=['GET'])
+def trace_stats():
+    # Slowest finished articles with the seconds spent in each stage
+    count = request.args.get('n', default=20, type=int)
+    return jsonify(tracer.slowest(count))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def hello_world():
     return 'Hello, World!'
@@ -75,14 +110,9 @@ def start_consumers():
     if not consumers_started:
         logger.info("Starting consumers before the first request")
         
-        consumer_threads = [
-            threading.Thread(target=consumer.data_to_process_consumer, name="DataToProcessConsumerThread"),
-            threading.Thread(target=consumer.scraper_consumer, name="ScraperConsumerThread")
-        ]
-        
-        for thread in consumer_threads:
-            thread.start()
-            logger.debug(f"Started {thread.name}")
+        consumer.start_consumers()
+        proxy_tracker.start()
+        tag_index.start()
         
         consumers_started = True
 
@@ -0,0 +1,104 @@
+"""
+p50/p99 scrape_url latency: sequential proxy rotation vs hedged requests.
+
+Fake proxies are distinct loopback addresses (127.0.x.y) on one local port.
+A few are dead (they hang past the timeout), some are slow and the rest
+answer with jitter. Each proxy answers the forwarded Reddit-style request
+itself. Needs a local Redis (REDIS_URL) for the health tracker and sticky
+proxies.
+
+    python benchmarks/bench_hedged.py --requests 200 --dead-rate 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import pullpush
+from proxy_health import ProxyHealthTracker
+
+
+def start_fake_proxies(behaviour, timeout):
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    holder = {}
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            address = writer.get_extra_info('sockname')[0]
+            kind = behaviour.get(address, 'fast')
+            if kind == 'dead':
+                await asyncio.sleep(timeout * 2)
+                return
+            await asyncio.sleep(random.uniform(0.5, 1.5) if kind == 'slow' else random.uniform(0.01, 0.08))
+            body = b'{"data": {"children": []}}'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '0.0.0.0', 0)
+        holder['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        await server.serve_forever()
+
+    threading.Thread(target=lambda: loop.run_until_complete(main()), daemon=True).start()
+    ready.wait()
+    return holder['port']
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(name, hedged, proxies_list, url, count):
+    latencies = []
+    failures = 0
+    for _ in range(count):
+        # Shuffled like a pool whose ranking is stale, so dead proxies do come up first
+        order = random.sample(proxies_list, len(proxies_list))
+        start = time.time()
+        data, _ = pullpush.scrape_url(order, pullpush.user_agents, url, hedged=hedged)
+        latencies.append(time.time() - start)
+        failures += data is None
+    print(f"{name:10s} p50 {percentile(latencies, 0.5) * 1000:8.1f} ms  p99 {percentile(latencies, 0.99) * 1000:8.1f} ms  failures {failures}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--proxies', type=int, default=20)
+    parser.add_argument('--dead-rate', type=float, default=0.2)
+    parser.add_argument('--slow-rate', type=float, default=0.2)
+    parser.add_argument('--timeout', type=float, default=2, help='per-attempt timeout (production uses 10s)')
+    args = parser.parse_args()
+
+    random.seed(0)
+    addresses = [f"127.0.1.{i + 1}" for i in range(args.proxies)]
+    behaviour = {}
+    for address in addresses:
+        roll = random.random()
+        behaviour[address] = 'dead' if roll < args.dead_rate else 'slow' if roll < args.dead_rate + args.slow_rate else 'fast'
+
+    port = start_fake_proxies(behaviour, args.timeout)
+    proxies_list = [f"http://{address}:{port}" for address in addresses]
+    url = f"http://bench-reddit.local:{port}/r/news/hot.json"
+
+    pullpush.request_timeout = args.timeout
+    pullpush.proxy_tracker = ProxyHealthTracker(ranking_key='bench_proxy_health')
+    pullpush.redis_client.delete('proxy:sticky:' + url.split('/')[2])
+
+    run('sequential', False, proxies_list, url, args.requests)
+    run('hedged', True, proxies_list, url, args.requests)
@@ -0,0 +1,116 @@
+"""
+Benchmark and equivalence check for json_utils.extract_json_data.
+
+Compares the single-pass extractor against the previous implementation
+(kept below as legacy_extract_json_data):
+
+1. A seeded property check on random adversarial strings made of stray
+   brackets, quotes, escapes, fences and JSON fragments. Inputs that send
+   the legacy loop into its infinite retry (an opening bracket after the
+   last closing one) are skipped.
+2. Timings on long LLM-style outputs with many stray braces.
+
+    python benchmarks/bench_json_utils.py --cases 200000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from json_utils import extract_json_data
+
+
+def legacy_extract_json_data(data):
+    json_data = {}
+    try:
+        json_data = json.loads(data)
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r'```json([\s\S]*?)```', data)
+    if match:
+        json_string = match.group(1).strip()
+        try:
+            json_data = json.loads(json_string)
+        except json.JSONDecodeError:
+            pass
+    for open_char, close_char in (('{', '}'), ('[', ']')):
+        if json_data:
+            break
+        first_open = -1
+        while True:
+            first_open = data.find(open_char, first_open + 1)
+            if first_open == -1:
+                break
+            first_close = data.rfind(close_char)
+            while first_close <= first_open:
+                first_close = data.rfind(close_char, 0, first_close)
+            candidate = data[first_open:first_close + 1]
+            try:
+                json_data = json.loads(candidate)
+                break
+            except json.JSONDecodeError:
+                first_close = data.rfind(close_char, 0, first_close)
+    return json_data
+
+
+ATOMS = ['{', '}', '[', ']', '"', '\\', '\\"', ' ', 'a', ':', ',', '1', '\n', '```json', '```', 'null', 'true',
+         '{}', '[]', '"\\\\"', '{"a": 1}', '[1, 2]', '{"t": "x}"}', '"{"', '{"s":"\\\\"}', '{"k": [1, {"x": "]"}]}']
+
+
+def legacy_terminates(data):
+    return all(open_char not in data or data.rfind(open_char) < data.rfind(close_char)
+               for open_char, close_char in (('{', '}'), ('[', ']')))
+
+
+def property_check(cases, seed):
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(cases):
+        data = ''.join(rng.choice(ATOMS) for _ in range(rng.randint(0, 16)))
+        if not legacy_terminates(data):
+            continue
+        checked += 1
+        expected = legacy_extract_json_data(data)
+        actual = extract_json_data(data)
+        if expected != actual or type(expected) is not type(actual):
+            raise AssertionError(f"{data!r}: legacy {expected!r} != new {actual!r}")
+    return checked
+
+
+def llm_outputs(size):
+    payload = json.dumps({'title': 'A title', 'summary': 'A summary {with braces}', 'tags': ['news', 'world']})
+    prose = 'Here is the {result} you asked for, see {notes} and {"partial": '
+    return {
+        'fenced': 'Sure!\n```json\n' + payload + '\n```\n' + prose * size,
+        'stray braces then object': prose * size + payload,
+        'long open prefix': '{"a": 1, ' * size + 'oops } ' + payload,
+        'no json': ('{ not json } ' * size) + 'done',
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', type=int, default=2000, help='repetitions of the adversarial fragment')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"property check: {property_check(args.cases, args.seed)} inputs identical")
+
+    for name, data in llm_outputs(args.size).items():
+        timings = {}
+        for label, fn in (('legacy', legacy_extract_json_data), ('single-pass', extract_json_data)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = fn(data)
+            timings[label] = (time.perf_counter() - start) / args.repeat
+        assert legacy_extract_json_data(data) == result
+        print(f"{name:26s} {len(data):8d} chars  legacy {timings['legacy'] * 1000:9.2f} ms  "
+              f"single-pass {timings['single-pass'] * 1000:7.2f} ms")
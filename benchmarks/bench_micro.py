@@ -0,0 +1,188 @@
+"""
+Micro-benchmarks of the per-item CPU-bound functions over the recorded corpus.
+
+Each benchmark runs its function over every matching fixture in
+benchmarks/corpus (see record_corpus.py) for at least --min-time seconds,
+--rounds times, and keeps the best round. Reported per benchmark:
+
+- ops/s: function calls per second in the best round
+- peak KiB/op: mean tracemalloc peak of one call, from a separate pass
+- retained blocks/op: mean number of memory blocks still allocated after one
+  call (the result and anything cached). Temporary allocations freed during
+  the call are not counted; peak KiB/op reflects those
+
+The results can be saved as a baseline (--save-baseline). Later runs are
+compared against it, and a benchmark is flagged when its ops/s drop, or its
+peak memory grows, by more than --threshold. The exit status is 1 when
+anything regressed. Baselines are only comparable on the same machine and
+corpus; the corpus fingerprint is stored with them and checked.
+
+    python benchmarks/bench_micro.py --save-baseline
+    python benchmarks/bench_micro.py --filter extract_json --threshold 0.05
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from bs4 import BeautifulSoup
+
+from fetcher import find_element, find_elements, HTML_PARSER
+from json_utils import extract_json_data
+from processor import process_text
+from pullpush import create_reddit_api_url, select_listing_posts
+
+CORPUS = os.path.join(ROOT, 'benchmarks', 'corpus')
+BASELINE = os.path.join(ROOT, 'benchmarks', 'micro_baseline.json')
+
+
+def load_corpus(directory):
+    corpus = {}
+    digest = hashlib.sha1()
+    for kind in ('html', 'articles', 'llm', 'reddit'):
+        path = os.path.join(directory, f"{kind}.jsonl")
+        records = []
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                content = file.read()
+            digest.update(content)
+            records = [json.loads(line) for line in content.decode('utf-8').splitlines() if line.strip()]
+        corpus[kind] = records
+    return corpus, digest.hexdigest()
+
+
+def build_cases(corpus):
+    """Benchmark name -> (function, list of argument tuples). Parsing is done here, outside the timed loop."""
+    element_cases, elements_cases = [], []
+    for record in corpus['html']:
+        soup = BeautifulSoup(record['html'], HTML_PARSER)
+        for name, selector in record['selectors'].items():
+            if name == 'link':
+                elements_cases.append((soup, selector))
+            else:
+                element_cases.append((soup, selector))
+    listings = [record for record in corpus['reddit'] if record.get('listing')]
+    return {
+        'find_element': (find_element, element_cases),
+        'find_elements': (find_elements, elements_cases),
+        'extract_json_data': (extract_json_data, [(record['output'],) for record in corpus['llm']]),
+        'process_text': (process_text, [(record['text'], 2000) for record in corpus['articles']]),
+        'create_reddit_api_url': (create_reddit_api_url, [(dict(record['url_json_object']),) for record in corpus['reddit']]),
+        'select_listing_posts': (select_listing_posts,
+                                 [(record['listing']['data']['children'], set(), record['agent']) for record in listings]),
+    }
+
+
+def time_round(function, cases, min_time):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for args in cases:
+            function(*args)
+        calls += len(cases)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def measure_memory(function, cases):
+    """Mean (peak KiB, retained blocks) of one call."""
+    peaks = 0
+    retained = 0
+    tracemalloc.start()
+    try:
+        for args in cases:
+            gc.collect()
+            tracemalloc.reset_peak()
+            before_size, _ = tracemalloc.get_traced_memory()
+            before_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+            result = function(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            after_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+            peaks += peak - before_size
+            retained += after_blocks - before_blocks
+            del result
+    finally:
+        tracemalloc.stop()
+    return peaks / len(cases) / 1024, retained / len(cases)
+
+
+def run(cases, rounds, min_time, name_filter):
+    results = {}
+    for name, (function, arguments) in cases.items():
+        if name_filter and name_filter not in name:
+            continue
+        if not arguments:
+            print(f"{name:24s} no fixtures in the corpus, skipped")
+            continue
+        gc.disable()
+        try:
+            ops = max(time_round(function, arguments, min_time) for _ in range(rounds))
+        finally:
+            gc.enable()
+        peak_kib, retained = measure_memory(function, arguments)
+        results[name] = {'ops_per_sec': ops, 'peak_kib_per_op': peak_kib, 'retained_blocks_per_op': retained,
+                         'fixtures': len(arguments)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks that got slower or hungrier than the baseline by more than `threshold`."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            result['change'] = 'new'
+            continue
+        speed = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        memory = (result['peak_kib_per_op'] / before['peak_kib_per_op'] - 1) if before['peak_kib_per_op'] else 0.0
+        result['change'] = f"{speed:+.1%} ops/s, {memory:+.1%} peak"
+        if speed < -threshold or memory > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown/memory growth')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds per round')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+
+    corpus, fingerprint = load_corpus(args.corpus)
+    print(f"corpus {fingerprint[:12]}: " + ', '.join(f"{len(records)} {kind}" for kind, records in corpus.items()))
+    results = run(build_cases(corpus), args.rounds, args.min_time, args.filter)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('corpus') != fingerprint:
+            print('warning: the baseline was recorded on a different corpus')
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+
+    print(f"\n{'benchmark':24s} {'fixtures':>8s} {'ops/s':>12s} {'peak KiB/op':>12s} {'retained/op':>11s}  vs baseline")
+    for name, result in results.items():
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:24s} {result['fixtures']:8d} {result['ops_per_sec']:12.1f} {result['peak_kib_per_op']:12.1f} "
+              f"{result['retained_blocks_per_op']:11.1f}  {result.get('change', '-')}{flag}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({'corpus': fingerprint, 'python': platform.python_version(), 'machine': platform.node(),
+                       'results': results}, file, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+    sys.exit(1 if regressions else 0)
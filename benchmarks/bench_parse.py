@@ -0,0 +1,105 @@
+"""
+Parse time and peak memory per page: full html.parser tree vs a ParsePlan.
+
+Reads saved pages from a corpus directory: every <name>.html may have a
+<name>.json next to it with {"title": [...], "content": [...]} selector
+chains (the controller's title and visit.content selectors). Without a
+corpus, synthetic news pages are generated.
+
+    python benchmarks/bench_parse.py --corpus benchmarks/corpus/pages
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+
+import fetcher
+from fetcher import find_element, get_parse_plan
+
+DEFAULT_CHAINS = {'title': [['h1']], 'content': [['div', 'class', 'story']]}
+
+
+def synthetic_pages(count):
+    nav = ''.join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(200))
+    paragraphs = ''.join(f'<p>Paragraph {i} ' + 'lorem ipsum dolor sit amet ' * 20 + '</p>' for i in range(60))
+    scripts = '<script>' + 'var x = 1;' * 2000 + '</script>'
+    for i in range(count):
+        html = (f'<html><head><title>Page {i}</title>{scripts}</head><body><nav><ul>{nav}</ul></nav>'
+                f'<h1>Headline {i}</h1><div class="story">{paragraphs}<img src="/a.jpg"></div>'
+                f'<aside>{nav}</aside><footer>{nav}</footer></body></html>')
+        yield f'synthetic-{i}', html.encode('utf-8'), DEFAULT_CHAINS
+
+
+def corpus_pages(directory):
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        chains = DEFAULT_CHAINS
+        selectors_path = path[:-len('.html')] + '.json'
+        if os.path.exists(selectors_path):
+            with open(selectors_path) as f:
+                chains = json.load(f)
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), f.read(), chains
+
+
+def full_parse(content, chains, parser):
+    soup = BeautifulSoup(content, parser)
+    return {name: find_element(soup, chain) for name, chain in chains.items()}
+
+
+def planned_parse(content, chains, parser=None):
+    plan = get_parse_plan(**chains)
+    soups = plan.parse(content)
+    return {name: find_element(soups[name], chain) for name, chain in chains.items()}
+
+
+def measure(fn, content, chains, parser, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(content, chains, parser)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    fn(content, chains, parser)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, {name: element.get_text(strip=True) if element else None for name, element in result.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus')
+    parser.add_argument('--pages', type=int, default=10, help='synthetic pages when no corpus is given')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = corpus_pages(args.corpus) if args.corpus else synthetic_pages(args.pages)
+    variants = [('html.parser full', full_parse, 'html.parser'),
+                (f'{fetcher.HTML_PARSER} full', full_parse, fetcher.HTML_PARSER),
+                (f'{fetcher.HTML_PARSER} plan', planned_parse, None)]
+    totals = {name: [0.0, 0] for name, _, _ in variants}
+    mismatches = 0
+    count = 0
+
+    for page_name, content, chains in pages:
+        count += 1
+        baseline = None
+        for name, fn, backend in variants:
+            elapsed, peak, extracted = measure(fn, content, chains, backend, args.repeat)
+            totals[name][0] += elapsed
+            totals[name][1] = max(totals[name][1], peak)
+            if baseline is None:
+                baseline = extracted
+            elif extracted != baseline:
+                mismatches += 1
+                print(f"  {page_name}: {name} extracted different text")
+
+    for name, (elapsed, peak) in totals.items():
+        print(f"{name:20s} {elapsed / max(count, 1) * 1000:8.2f} ms/page  peak {peak / 1024:9.1f} KiB")
+    print(f"{count} pages, {mismatches} mismatches")
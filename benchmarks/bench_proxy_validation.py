@@ -0,0 +1,90 @@
+"""
+Threaded vs asyncio proxy validation against local fake proxies.
+
+Each fake proxy is a distinct loopback address (127.0.x.y) on one port. A
+proxy answers the forwarded GET itself after a random delay, or drops the
+connection to simulate a dead proxy. Needs a local Redis (REDIS_URL).
+
+    python benchmarks/bench_proxy_validation.py --proxies 2000 --failure-rate 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import proxies
+from proxy_health import ProxyHealthTracker
+
+
+def start_fake_proxies(max_delay, failure_rate, slow_rate):
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    holder = {}
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            roll = random.random()
+            if roll < failure_rate:
+                writer.close()
+                return
+            delay = random.uniform(0, max_delay)
+            if roll < failure_rate + slow_rate:
+                delay += proxies.max_response_time  # over the limit, should be rejected
+            await asyncio.sleep(delay)
+            body = b'{"ok": true}'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s' % (len(body), body))
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '0.0.0.0', 0, backlog=4096)
+        holder['port'] = server.sockets[0].getsockname()[1]
+        ready.set()
+        await server.serve_forever()
+
+    threading.Thread(target=lambda: loop.run_until_complete(main()), daemon=True).start()
+    ready.wait()
+    return holder['port']
+
+
+def run(name, fn, proxies_list):
+    start = time.time()
+    result = fn(proxies_list)
+    elapsed = time.time() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{name:9s} {len(proxies_list):6d} proxies in {elapsed:7.2f}s  {len(result):6d} usable  peak rss {peak_mb:7.1f} MB")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--proxies', type=int, default=2000)
+    parser.add_argument('--max-delay', type=float, default=2.0)
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    port = start_fake_proxies(args.max_delay, args.failure_rate, args.slow_rate)
+    proxies_list = [f"http://127.0.{i // 250}.{i % 250 + 1}:{port}" for i in range(args.proxies)]
+
+    proxies.test_url = f"http://127.0.0.1:{port}/get"
+    proxies.redis_key = 'bench_fastest_proxies'
+    proxies.proxy_tracker = ProxyHealthTracker(ranking_key='bench_proxy_health')
+
+    # asyncio first: peak RSS is process-wide and only grows
+    run('asyncio', proxies.get_fastest_proxies, proxies_list)
+    run('threaded', proxies.get_fastest_proxies_threaded, proxies_list)
@@ -0,0 +1,63 @@
+"""
+Messages/sec of the old connect-per-call producer vs the pooled Publisher.
+
+Needs a local broker reachable via CLOUDAMQP_URL.
+
+    python benchmarks/bench_publisher.py --messages 500
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pika
+
+from config import params
+from publisher import Publisher
+
+QUEUE = 'bench_publisher'
+
+
+def connect_per_call(body):
+    # The producer() implementation this replaced
+    connection = pika.BlockingConnection(params)
+    channel = connection.channel()
+    channel.queue_declare(queue=QUEUE)
+    channel.basic_publish(exchange='', routing_key=QUEUE, body=body)
+    connection.close()
+
+
+def report(name, count, elapsed):
+    print(f"{name:28s} {count / elapsed:10.1f} msg/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=50)
+    args = parser.parse_args()
+
+    start = time.time()
+    for i in range(args.messages):
+        connect_per_call(str(i))
+    report('connection per publish', args.messages, time.time() - start)
+
+    for confirm in (False, True):
+        pub = Publisher(confirm=confirm)
+        start = time.time()
+        for i in range(args.messages):
+            pub.publish(QUEUE, [str(i)])
+        report(f'pooled, single (confirm={confirm})', args.messages, time.time() - start)
+
+        start = time.time()
+        for i in range(0, args.messages, args.batch):
+            pub.publish(QUEUE, [str(j) for j in range(i, min(i + args.batch, args.messages))])
+        report(f'pooled, batched (confirm={confirm})', args.messages, time.time() - start)
+        pub.close()
+
+    connection = pika.BlockingConnection(params)
+    connection.channel().queue_delete(queue=QUEUE)
+    connection.close()
@@ -0,0 +1,84 @@
+"""
+Sequential vs concurrent article fetching in processor.scrape_data.
+
+Serves a canned listing page and N article pages from a local HTTP server
+with an artificial per-request delay. Needs a local Redis (REDIS_URL) for the
+link dedup checks; posting to PocketBase is replaced by a collector.
+
+    python benchmarks/bench_scrape.py --articles 40 --delay-ms 100
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import processor
+
+BODY = ' '.join(['lorem ipsum dolor sit amet'] * 200)
+
+
+def make_handler(articles, delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            run, _, page = self.path.strip('/').partition('/')
+            if page == 'listing':
+                links = ''.join(f'<li><a href="/{run}/article-{i}">Article {i}</a></li>' for i in range(articles))
+                html = f'<html><body><ul class="news">{links}</ul></body></html>'
+            else:
+                html = f'<html><body><h1>{page}</h1><div class="story"><p>{BODY}</p><img src="/img/{page}.jpg"></div></body></html>'
+            payload = html.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def configuration(base_url, run):
+    return {
+        'id': 'bench',
+        'author_id': 'bench',
+        'controller': {
+            'main_link': f'{base_url}/{run}/listing',
+            'link': {'selector': [['ul', 'class', 'news'], ['a']]},
+            'title': {'selector': [['h1']]},
+            'visit': {'content': {'selector': [['div', 'class', 'story']]}},
+        },
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=40)
+    parser.add_argument('--delay-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.articles, args.delay_ms / 1000.0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    posted = []
+    processor.post_data_to_api = lambda data: posted.extend(data)
+
+    outputs = {}
+    for name, workers in (('sequential', 1), ('concurrent', processor.SCRAPE_MAX_WORKERS)):
+        run = uuid.uuid4().hex  # fresh links so the Redis dedup doesn't skip them
+        start = time.time()
+        results = processor.scrape_data(configuration(base_url, run), max_workers=workers)
+        elapsed = time.time() - start
+        outputs[name] = {(r['link'].rsplit('/', 1)[-1], r['title'], r['content']) for r in results}
+        print(f"{name:10s} {len(results):4d} articles in {elapsed:6.2f}s ({len(results) / elapsed:6.1f}/s)")
+
+    print('same output set:', outputs['sequential'] == outputs['concurrent'])
+    server.shutdown()
@@ -0,0 +1,282 @@
+"""
+Local HTTP fakes of every external service the pipeline talks to.
+
+Each service runs on its own ThreadingHTTPServer on 127.0.0.1 so per-host
+connection pools and limits behave as they would against the real hosts:
+
+- PocketBase: scraper_controllers, lambda_fxns, view_articles_list, the
+  scrape_data collection (create/read/update and /api/batch) and the
+  articles collection, which records when each processed article lands.
+- Groq chat completions and Gemini generateContent, with a fixed latency
+  and an optional 429 every N requests.
+- A Reddit JSON API serving listings and comment threads.
+- News sites with a listing page and article pages.
+- Forward HTTP proxies with configurable latency and failure rate.
+
+Content and injected failures are derived from request counters and page
+names, so a run needs no network and repeats the same work every time.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WORDS = 'the market council report season team players city policy data growth energy local national said'.split()
+
+
+def words(count, seed):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+class Service:
+    """Base class: a threaded HTTP server with a JSON helper and request counters."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._counter = 0
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                service.count(self.command)
+                if service.latency:
+                    time.sleep(service.latency)
+                status, headers, payload = service.handle(self.command, self.path, self.headers, body)
+                if not isinstance(payload, (bytes, str)):
+                    payload = json.dumps(payload)
+                    headers = {'Content-Type': 'application/json', **headers}
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def count(self, command):
+        with self._lock:
+            self.requests[command] += 1
+
+    def next_id(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def handle(self, method, path, headers, body):
+        raise NotImplementedError
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class FakePocketBase(Service):
+    def __init__(self, controllers, latency=0.0):
+        super().__init__(latency)
+        self.controllers = controllers
+        self.records = {}
+        self.articles = []  # (time, record id)
+        self.failed = []  # (time, record id)
+
+    def _create(self, payload):
+        record_id = f"{self.next_id():015d}"
+        with self._lock:
+            self.records[record_id] = {'id': record_id, 'trial_times': 0, **payload}
+        return record_id
+
+    def handle(self, method, path, headers, body):
+        parsed = urlparse(path)
+        parts = parsed.path.strip('/').split('/')
+        payload = json.loads(body) if body else None
+        if parts[:2] == ['api', 'batch'] and method == 'POST':
+            results = []
+            for request in payload.get('requests', []):
+                results.append({'status': 200, 'body': {'id': self._create(request.get('body') or {})}})
+            return 200, {}, results
+        if parts[:2] != ['api', 'collections'] or len(parts) < 4:
+            return 404, {}, {'message': 'not found'}
+        collection = parts[2]
+        record_id = parts[4] if len(parts) > 4 else None
+        if collection == 'scraper_controllers':
+            return 200, {}, {'page': 1, 'totalPages': 1, 'items': self.controllers}
+        if collection == 'lambda_fxns':
+            return 200, {}, {'page': 1, 'totalPages': 1, 'items': []}
+        if collection == 'view_articles_list':
+            page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+            items = [{'tags': ['news', WORDS[(page + i) % len(WORDS)], WORDS[i % len(WORDS)]]} for i in range(50)]
+            return 200, {}, {'page': page, 'totalPages': 1, 'items': items}
+        if collection == 'scrape_data':
+            if method == 'POST':
+                return 200, {}, {'id': self._create(payload)}
+            with self._lock:
+                record = self.records.get(record_id)
+                if record is not None and method == 'PATCH':
+                    record.update(payload)
+                    if payload.get('failed_to_process'):
+                        self.failed.append((time.time(), record_id))
+            if record is None:
+                return 404, {}, {'message': 'not found'}
+            return 200, {}, record
+        if collection == 'articles' and method == 'POST':
+            with self._lock:
+                self.articles.append((time.time(), payload.get('id')))
+            return 200, {}, {'id': f"{self.next_id():015d}"}
+        return 404, {}, {'message': 'not found'}
+
+
+class FakeLLM(Service):
+    """Groq chat completions or Gemini generateContent, depending on `kind`."""
+
+    def __init__(self, kind, latency=0.0, words_per_reply=350, rate_limit_every=0):
+        super().__init__(latency)
+        self.kind = kind
+        self.words_per_reply = words_per_reply
+        self.rate_limit_every = rate_limit_every
+        self.rate_limited = 0
+
+    def handle(self, method, path, headers, body):
+        number = self.next_id()
+        if self.rate_limit_every and number % self.rate_limit_every == 0:
+            with self._lock:
+                self.rate_limited += 1
+            return 429, {'x-ratelimit-reset-requests': '1s'}, {'error': {'message': 'rate limited'}}
+        text = words(self.words_per_reply, number) + '\n' + json.dumps({
+            'title': f"Generated title {number}",
+            'summary': words(30, -number),
+            'tags': ['news', WORDS[number % len(WORDS)]],
+        })
+        if self.kind == 'gemini':
+            return 200, {}, {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+        return 200, {'x-ratelimit-reset-requests': '1s'}, {'choices': [{'message': {'content': text}}]}
+
+
+class FakeReddit(Service):
+    def __init__(self, run, posts_per_listing=20, comments_per_post=15, latency=0.0):
+        super().__init__(latency)
+        self.run = run
+        self.posts_per_listing = posts_per_listing
+        self.comments_per_post = comments_per_post
+
+    def handle(self, method, path, headers, body):
+        parts = urlparse(path).path.strip('/').split('/')
+        # /r/<subreddit>/comments/<id>/.json
+        if len(parts) >= 4 and parts[2] == 'comments':
+            children = [{'kind': 't1', 'data': {'author': f"user{i}", 'body': words(25, i)}}
+                        for i in range(self.comments_per_post)]
+            return 200, {}, [{'data': {'children': []}}, {'data': {'children': children}}]
+        # /r/<subreddit>/<sort>.json
+        subreddit = parts[1]
+        posts = []
+        for i in range(self.posts_per_listing):
+            post_id = f"{self.run}{subreddit}{i}"
+            posts.append({'kind': 't3', 'data': {
+                'id': post_id, 'name': f"t3_{post_id}", 'title': f"{subreddit} post {i}",
+                'author': f"author{i}", 'created_utc': 1700000000 + i, 'subreddit': subreddit,
+                'selftext': words(200, f"{subreddit}{i}"), 'num_comments': 40, 'ups': 100, 'score': 120,
+                'link_flair_text': None, 'url': f"https://reddit.example/{post_id}",
+                'permalink': f"/r/{subreddit}/comments/{post_id}/",
+            }})
+        return 200, {}, {'data': {'children': posts}}
+
+
+class FakeSite(Service):
+    """News site: /<site>/listing links to /<site>/article-<i>."""
+
+    def __init__(self, run, articles_per_listing=20, latency=0.0):
+        super().__init__(latency)
+        self.run = run
+        self.articles_per_listing = articles_per_listing
+
+    def handle(self, method, path, headers, body):
+        site, _, page = urlparse(path).path.strip('/').partition('/')
+        if page == 'listing':
+            links = ''.join(f'<li><a href="/{site}/{self.run}-article-{i}">Article {i}</a></li>'
+                            for i in range(self.articles_per_listing))
+            html = f'<html><body><nav><a href="/">Home</a></nav><ul class="news">{links}</ul></body></html>'
+        else:
+            number = page.rsplit('-', 1)[-1]
+            paragraphs = ''.join(f'<p>{words(60, f"{site}-{number}-{i}")}</p>' for i in range(6))
+            html = (f'<html><head><title>{page}</title></head><body><h1>{site} {page}</h1>'
+                    f'<div class="story">{paragraphs}<img src="/img/{page}.jpg"></div>'
+                    f'<footer>{words(40, "footer")}</footer></body></html>')
+        return 200, {'Content-Type': 'text/html'}, html
+
+
+class FakeProxy(Service):
+    """Forward proxy for plain-HTTP targets; every `fail_every`-th request is answered with a 502."""
+
+    def __init__(self, latency=0.0, fail_every=0):
+        super().__init__(latency)
+        self.fail_every = fail_every
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def handle(self, method, path, headers, body):
+        number = self.next_id()
+        if self.fail_every and number % self.fail_every == 0:
+            return 502, {}, b'bad gateway'
+        request = urllib.request.Request(path, data=body or None, method=method,
+                                         headers={'User-Agent': headers.get('User-Agent', 'bench')})
+        try:
+            with self._opener.open(request, timeout=30) as response:
+                return response.status, {'Content-Type': response.headers.get('Content-Type', 'application/json')}, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, {}, e.read()
+        except OSError as e:
+            return 502, {}, str(e)
+
+
+def controllers(site_url, sites, subreddits, gemini_every=0):
+    """scraper_controllers records for `sites` website and `subreddits` Reddit agents."""
+    records = []
+    for i in range(sites + subreddits):
+        record = {
+            'id': f"ctrl{i:011d}",
+            'author_id': f"author{i % 3}",
+            'sub_menu_list_id': 'bench',
+            'tags': ['news'],
+            'model': 'gemini' if gemini_every and i % gemini_every == 0 else 'mixtral-8x7b-32768',
+            'tst_model': 'gemma-7b-it',
+            'ai_content_system_prompt': 'Rewrite the article as of ___DATETIME___.',
+            'ai_tst_system_prompt': 'Return a JSON object with title, summary and tags.',
+        }
+        if i < sites:
+            record['source'] = 'website'
+            record['controller'] = {
+                'main_link': f"{site_url}/site{i}/listing",
+                'link': {'selector': [['ul', 'class', 'news'], ['a']]},
+                'title': {'selector': [['h1']]},
+                'visit': {'content': {'selector': [['div', 'class', 'story']]}},
+            }
+        else:
+            record['source'] = 'reddit'
+            record['controller'] = {
+                'subreddit': f"sub{i}",
+                'post_types': ['hot'],
+                'timeframes': ['day'],
+                'fetch_pullpush': False,
+                'comment_fanout': 5,
+            }
+        records.append(record)
+    return records
@@ -0,0 +1,208 @@
+"""
+In-memory stand-in for the parts of pika's BlockingConnection the app uses.
+
+install() replaces pika.BlockingConnection, so publisher.py and consumer.py
+run unchanged against queues held in this process: basic_publish,
+basic_get, basic_qos/basic_consume/start_consuming with prefetch,
+basic_ack/basic_nack (with requeue and the redelivered flag),
+add_callback_threadsafe and call_later. Used by benchmarks/load_test.py
+when no broker is given; it has no persistence and no exchanges other than
+the default one.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import pika
+
+
+class Broker:
+    def __init__(self):
+        self.queues = {}
+        self.condition = threading.Condition()
+        self.published = 0
+        self.delivered = 0
+
+    def declare(self, queue):
+        with self.condition:
+            return self.queues.setdefault(queue, deque())
+
+    def put(self, queue, body, properties, redelivered=False, front=False):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self.condition:
+            messages = self.queues.setdefault(queue, deque())
+            if front:
+                messages.appendleft((body, properties, redelivered))
+            else:
+                messages.append((body, properties, redelivered))
+                self.published += 1
+            self.condition.notify_all()
+
+    def take(self, queue):
+        """Pop the next message of `queue`, or None. Call with the condition held."""
+        messages = self.queues.get(queue)
+        if messages:
+            self.delivered += 1
+            return messages.popleft()
+        return None
+
+    def depth(self):
+        with self.condition:
+            return {queue: len(messages) for queue, messages in self.queues.items()}
+
+
+broker = Broker()
+
+
+class Channel:
+    _tags = itertools.count(1)
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.prefetch_count = 0
+        self._consumers = []  # (queue, callback)
+        self._unacked = {}  # delivery_tag -> (queue, body, properties)
+        self._consuming = False
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, **kwargs):
+        broker.declare(queue)
+
+    def queue_purge(self, queue):
+        with broker.condition:
+            broker.queues.get(queue, deque()).clear()
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, **kwargs):
+        broker.put(routing_key, body, properties)
+
+    def basic_get(self, queue, auto_ack=False):
+        with broker.condition:
+            message = broker.take(queue)
+            if message is None:
+                return None, None, None
+            body, properties, redelivered = message
+            tag = next(self._tags)
+            self._unacked[tag] = (queue, body, properties)
+        return SimpleNamespace(delivery_tag=tag, redelivered=redelivered), properties, body
+
+    def basic_ack(self, delivery_tag, **kwargs):
+        with broker.condition:
+            self._unacked.pop(delivery_tag, None)
+            broker.condition.notify_all()
+
+    def basic_nack(self, delivery_tag, requeue=True, **kwargs):
+        with broker.condition:
+            message = self._unacked.pop(delivery_tag, None)
+        if message is not None and requeue:
+            queue, body, properties = message
+            broker.put(queue, body, properties, redelivered=True, front=True)
+        else:
+            with broker.condition:
+                broker.condition.notify_all()
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        self._consumers.append((queue, on_message_callback))
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open:
+            self.connection.run_callbacks()
+            delivery = None
+            with broker.condition:
+                if not self.prefetch_count or len(self._unacked) < self.prefetch_count:
+                    for queue, callback in self._consumers:
+                        message = broker.take(queue)
+                        if message is not None:
+                            body, properties, redelivered = message
+                            tag = next(self._tags)
+                            self._unacked[tag] = (queue, body, properties)
+                            delivery = (callback, SimpleNamespace(delivery_tag=tag, redelivered=redelivered), properties, body)
+                            break
+                if delivery is None and not self.connection.pending_callbacks():
+                    broker.condition.wait(0.05)
+            if delivery is not None:
+                callback, method, properties, body = delivery
+                callback(self, method, properties or pika.BasicProperties(), body)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def close(self):
+        # Unacked messages go back to their queue, as the broker would do
+        with broker.condition:
+            unacked, self._unacked = self._unacked, {}
+        for queue, body, properties in unacked.values():
+            broker.put(queue, body, properties, redelivered=True, front=True)
+        self.is_open = False
+
+
+class BlockingConnection:
+    def __init__(self, parameters=None):
+        self.is_open = True
+        self._channels = []
+        self._callbacks = deque()
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self):
+        channel = Channel(self)
+        self._channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed')
+        with broker.condition:
+            self._callbacks.append(callback)
+            broker.condition.notify_all()
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, lambda: self.is_open and self.add_callback_threadsafe(callback))
+        timer.daemon = True
+        timer.start()
+
+    def pending_callbacks(self):
+        return bool(self._callbacks)
+
+    def run_callbacks(self):
+        while True:
+            with broker.condition:
+                if not self._callbacks:
+                    return
+                callback = self._callbacks.popleft()
+            callback()
+
+    def process_data_events(self, time_limit=0):
+        self.run_callbacks()
+        if time_limit:
+            time.sleep(time_limit)
+
+    def sleep(self, duration):
+        time.sleep(duration)
+
+    def close(self):
+        for channel in self._channels:
+            if channel.is_open:
+                channel.close()
+        self.is_open = False
+
+
+def install():
+    """Route every pika.BlockingConnection in this process to the in-memory broker."""
+    pika.BlockingConnection = BlockingConnection
+    return broker
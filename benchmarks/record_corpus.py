@@ -0,0 +1,163 @@
+"""
+Record production inputs into the fixture corpus used by bench_micro.py.
+
+Reads the scraper controllers from PocketBase and, for each one, captures
+what the per-item CPU-bound functions actually see:
+
+- website controllers: the listing page and a few article pages, with the
+  controller's selectors (html.jsonl), and the extracted article text
+  (articles.jsonl)
+- Reddit controllers: the url_json_object and agent settings, and the
+  listing JSON fetched through the proxy pool (reddit.jsonl)
+- with --llm N: raw Groq replies to the title/summary/tags prompt for N
+  recorded articles (llm.jsonl); needs GROQ_API_KEY
+
+Runs against the services configured in config.py (so it needs network,
+Redis and working proxies for Reddit). Existing files are replaced unless
+--append is given.
+
+    python benchmarks/record_corpus.py --sites 5 --articles 5 --subreddits 3 --llm 20
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from urllib.parse import urljoin
+
+import http_client
+from bs4 import BeautifulSoup
+from config import GROQ_API_KEY, GROQ_API_URL
+from fetcher import fetch_page, find_element, find_elements, HTML_PARSER
+from pullpush import create_reddit_api_url, default_agent, get_fast_proxies, scrape_url, user_agents
+from registry import controller_registry
+
+CORPUS = os.path.join(ROOT, 'benchmarks', 'corpus')
+AGENT_KEYS = ('max_selftext_words', 'min_comments', 'min_ups', 'min_score')
+
+
+class CorpusWriter:
+    def __init__(self, directory, append):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.mode = 'a' if append else 'w'
+        self._files = {}
+        self.counts = {}
+
+    def write(self, kind, record):
+        if kind not in self._files:
+            self._files[kind] = open(os.path.join(self.directory, f"{kind}.jsonl"), self.mode, encoding='utf-8')
+        self._files[kind].write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def close(self):
+        for file in self._files.values():
+            file.close()
+
+
+def record_website(writer, controller, articles):
+    config = controller['controller']
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    listing_url = config['main_link']
+    content = fetch_page(listing_url, headers)
+    if content is None:
+        return []
+    html = content.decode('utf-8', errors='replace')
+    writer.write('html', {'url': listing_url, 'html': html, 'selectors': {'link': config['link']['selector']}})
+
+    links = []
+    for element in find_elements(BeautifulSoup(html, HTML_PARSER), config['link']['selector']):
+        href = element.get('href')
+        if href:
+            href = urljoin(listing_url, href)
+            if href not in links:
+                links.append(href)
+
+    texts = []
+    for link in links[:articles]:
+        content = fetch_page(link, headers)
+        if content is None:
+            continue
+        html = content.decode('utf-8', errors='replace')
+        selectors = {'title': config['title']['selector'], 'content': config['visit']['content']['selector']}
+        writer.write('html', {'url': link, 'html': html, 'selectors': selectors})
+        element = find_element(BeautifulSoup(html, HTML_PARSER), selectors['content'])
+        if element is not None:
+            text = element.text.strip()
+            writer.write('articles', {'url': link, 'text': text})
+            texts.append(text)
+    return texts
+
+
+def record_reddit(writer, controller):
+    agent = {**default_agent, **controller['controller']}
+    url_json_object = {
+        **agent.get('url_json_object', {}),
+        'subreddit': agent['subreddit'],
+        'sort': agent['post_types'][0],
+        't': agent.get('timeframes', ['week'])[0],
+        'tags': agent.get('search_tags', [])[:3],
+    }
+    url = create_reddit_api_url(url_json_object)
+    listing, _ = scrape_url(get_fast_proxies(), user_agents, url)
+    if listing is None:
+        raise RuntimeError(f"no proxy returned {url}")
+    writer.write('reddit', {
+        'url_json_object': url_json_object,
+        'agent': {key: agent[key] for key in AGENT_KEYS},
+        'listing': listing,
+    })
+
+
+def record_llm(writer, controller, text):
+    model = controller.get('tst_model') or 'gemma-7b-it'
+    data = {
+        "messages": [
+            {"role": "system", "content": controller['ai_tst_system_prompt']},
+            {"role": "user", "content": text}
+        ],
+        "model": model,
+        "temperature": 1,
+        "max_tokens": 1024,
+        "top_p": 1,
+        "stream": False
+    }
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {GROQ_API_KEY}"}
+    response = http_client.post(GROQ_API_URL, headers=headers, json=data)
+    if response.status_code == 200:
+        writer.write('llm', {'model': model, 'output': response.json()['choices'][0]['message']['content']})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sites', type=int, default=5, help='website controllers to record')
+    parser.add_argument('--articles', type=int, default=5, help='article pages per website')
+    parser.add_argument('--subreddits', type=int, default=3, help='Reddit controllers to record')
+    parser.add_argument('--llm', type=int, default=0, help='raw title/summary/tags replies to record')
+    parser.add_argument('--out', default=CORPUS)
+    parser.add_argument('--append', action='store_true')
+    args = parser.parse_args()
+
+    writer = CorpusWriter(args.out, args.append)
+    samples = []  # (controller, article text) for the LLM replies
+    try:
+        for controller in controller_registry.by_source('website')[:args.sites]:
+            try:
+                samples.extend((controller, text) for text in record_website(writer, controller, args.articles))
+            except Exception as e:
+                print(f"skipping website controller {controller.get('id')}: {e}")
+        for controller in controller_registry.by_source('reddit')[:args.subreddits]:
+            try:
+                record_reddit(writer, controller)
+            except Exception as e:
+                print(f"skipping Reddit controller {controller.get('id')}: {e}")
+        for controller, text in samples[:args.llm]:
+            if controller.get('ai_tst_system_prompt'):
+                record_llm(writer, controller, text)
+    finally:
+        writer.close()
+    print(f"recorded into {args.out}: {writer.counts}")
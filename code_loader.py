@@ -0,0 +1,61 @@
+import hashlib
+import threading
+
+from cachetools import LRUCache
+
+# Compiled code objects and the functions they define, keyed by a hash of the source
+_compiled = LRUCache(maxsize=256)
+_functions = LRUCache(maxsize=256)
+_lock = threading.Lock()
+
+
+def source_hash(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def compile_source(source, mode='exec', label='remote'):
+    """Compile `source` once per distinct text and reuse the code object afterwards."""
+    key = (source_hash(source), mode)
+    with _lock:
+        code = _compiled.get(key)
+    if code is None:
+        code = compile(source, f"<{label}:{key[0][:8]}>", mode)
+        with _lock:
+            _compiled[key] = code
+    return code
+
+
+def load_function(source, name, namespace):
+    """
+    Run `source` once in `namespace` (used as globals) and return the function it defines as `name`.
+
+    The function is cached by source hash, so a changed remote record is picked
+    up as soon as its new source is seen and an unchanged one is never re-run.
+    """
+    key = (source_hash(source), name, id(namespace))
+    with _lock:
+        function = _functions.get(key)
+    if function is None:
+        local_vars = {}
+        exec(compile_source(source, label=name), namespace, local_vars)
+        function = local_vars[name]
+        with _lock:
+            _functions[key] = function
+    return function
+
+
+def compile_lambda(expression, namespace, argument='response'):
+    """
+    Cached `lambda <argument>: <expression>` built from a remote extraction expression.
+
+    `namespace` is used as the lambda's globals, so the expression sees the
+    names the calling module imports (callers pass their `globals()`).
+    """
+    key = (source_hash(expression), argument, id(namespace))
+    with _lock:
+        function = _functions.get(key)
+    if function is None:
+        function = eval(compile_source(f"lambda {argument}: {expression}", mode='eval', label='lambda'), namespace)
+        with _lock:
+            _functions[key] = function
+    return function
@@ -1,12 +1,15 @@
 ## config.py
 
 import os
+import json
 import redis
 import pika
 import logging
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Per-message debug logging is costly under load, keep it off unless needed
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Configuration
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
@@ -17,26 +20,129 @@ HEADERS_TO_POST = {
     "Content-Type": "application/json",
     "Authorization": f"Bearer {GROQ_API_KEY}"
 }
-TEMP_API_URL = 'https://full-bit.pockethost.io/api/collections/scrape_data/records'
+# External services, overridable so the pipeline can run against local fakes (benchmarks/load_test.py)
+POCKETBASE_URL = os.getenv('POCKETBASE_URL', 'https://stories-blog.pockethost.io')
+TEMP_POCKETBASE_URL = os.getenv('TEMP_POCKETBASE_URL', 'https://full-bit.pockethost.io')
+GROQ_API_URL = os.getenv('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
+GEMINI_API_URL = os.getenv('GEMINI_API_URL', 'https://generativelanguage.googleapis.com/v1beta')
+REDDIT_API_URL = os.getenv('REDDIT_API_URL', 'https://oauth.reddit.com')
+PROXY_TEST_URL = os.getenv('PROXY_TEST_URL', 'https://httpbin.org/get')
+TEMP_API_URL = f'{TEMP_POCKETBASE_URL}/api/collections/scrape_data/records'
 REDIS_CACHE_EXPIRATION = 30 * 60  # 30 minutes in seconds
 
+# Consumer settings: 'push' uses basic_consume with prefetch, 'poll' keeps the old basic_get loop
+CONSUMER_MODE = os.getenv('CONSUMER_MODE', 'push')
+CONSUMER_PREFETCH_COUNT = int(os.getenv('CONSUMER_PREFETCH_COUNT', '4'))
+CONSUMER_WORKERS = int(os.getenv('CONSUMER_WORKERS', '2'))
+CONSUMER_POLL_INTERVAL = float(os.getenv('CONSUMER_POLL_INTERVAL', '1'))  # idle sleep for 'poll' mode
+LLM_CONSUMER_WORKERS = int(os.getenv('LLM_CONSUMER_WORKERS', '8'))  # articles in flight on data_to_process_consumer
+LLM_CONSUMER_PREFETCH_COUNT = int(os.getenv('LLM_CONSUMER_PREFETCH_COUNT', '8'))
+
+# Publisher settings
+PUBLISHER_CONFIRMS = os.getenv('PUBLISHER_CONFIRMS', '0') == '1'
+PUBLISHER_MAX_RETRIES = int(os.getenv('PUBLISHER_MAX_RETRIES', '3'))
+
+# Article fetching concurrency
+SCRAPE_MAX_WORKERS = int(os.getenv('SCRAPE_MAX_WORKERS', '16'))
+SCRAPE_PER_HOST_LIMIT = int(os.getenv('SCRAPE_PER_HOST_LIMIT', '4'))
+
+# Bulk ingest of scraped articles into PocketBase
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '20'))
+INGEST_WINDOW = float(os.getenv('INGEST_WINDOW', '2'))  # seconds a partial batch may wait
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', '8'))
+PB_BATCH_API = os.getenv('PB_BATCH_API', 'auto')  # 'auto' tries PocketBase's /api/batch once, '0' disables it
+
+# Outbound HTTP pooling
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '32'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+HTTP_PROXY_SESSIONS = int(os.getenv('HTTP_PROXY_SESSIONS', '64'))  # proxied sessions kept open, least recently used are closed
+
+# How long remotely loaded functions (lambda_fxns records) are cached before checking for changes
+REMOTE_CODE_CACHE_TTL = int(os.getenv('REMOTE_CODE_CACHE_TTL', '600'))
+
+# Shared tag co-occurrence index
+TAG_INDEX_PAGES = int(os.getenv('TAG_INDEX_PAGES', '5'))  # pages of recent articles to aggregate
+TAG_INDEX_INTERVAL = int(os.getenv('TAG_INDEX_INTERVAL', '900'))  # seconds between rebuilds
+
+# BeautifulSoup backend for scraped pages; falls back to html.parser when lxml is missing
+HTML_PARSER = os.getenv('HTML_PARSER', 'lxml')
+
+# How long ETag/Last-Modified/body-hash validators are kept per URL
+HTTP_VALIDATOR_TTL = int(os.getenv('HTTP_VALIDATOR_TTL', str(6 * 60 * 60)))
+
+# In-process (L1) cache in front of Redis
+LOCAL_CACHE_MAXSIZE = int(os.getenv('LOCAL_CACHE_MAXSIZE', '256'))
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', '60'))
+LOCAL_CACHE_STALE_TTL = int(os.getenv('LOCAL_CACHE_STALE_TTL', '300'))  # serve stale while refreshing
+CACHE_INVALIDATION_CHANNEL = 'cache:invalidate'
+
+# LLM rate limits shared by all workers, keyed "provider:model" with "provider" as the fallback
+LLM_RATE_LIMITS = json.loads(os.getenv('LLM_RATE_LIMITS', json.dumps({
+    "groq": {"rpm": 30, "tpm": 15000},
+    "gemini": {"rpm": 15, "tpm": 1000000},
+})))
+LLM_PROVIDER_CONCURRENCY = json.loads(os.getenv('LLM_PROVIDER_CONCURRENCY', json.dumps({"groq": 4, "gemini": 2})))
+
+# Generated content and title/summary/tags are cached by (model, prompt, input) for this long; 0 disables it
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 60 * 60)))
+# Generated content is written against the current date (___DATETIME___ in the prompt), so it is kept much shorter
+LLM_CONTENT_CACHE_TTL = int(os.getenv('LLM_CONTENT_CACHE_TTL', str(6 * 60 * 60)))
+
+# Proxy health tracking
+PROXY_HEALTH_ALPHA = float(os.getenv('PROXY_HEALTH_ALPHA', '0.3'))  # EWMA weight of the newest sample
+PROXY_SAMPLE_BATCH = int(os.getenv('PROXY_SAMPLE_BATCH', '20'))
+PROXY_SAMPLE_INTERVAL = float(os.getenv('PROXY_SAMPLE_INTERVAL', '5'))
+
+# Hedged Reddit requests: fire a backup proxy after the p90 latency instead of waiting for a timeout
+SCRAPE_HEDGED = os.getenv('SCRAPE_HEDGED', '1') == '1'
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '2'))  # used until enough latencies are observed
+
+# Seconds between pushes of in-process metric deltas to Redis
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Finished article traces are kept this long; only the slowest TRACE_KEEP are ranked
+TRACE_TTL = int(os.getenv('TRACE_TTL', str(24 * 60 * 60)))
+TRACE_KEEP = int(os.getenv('TRACE_KEEP', '1000'))
+
+# Key flushes run as background jobs; status is kept this long
+FLUSH_SCAN_COUNT = int(os.getenv('FLUSH_SCAN_COUNT', '1000'))
+FLUSH_JOB_TTL = 24 * 60 * 60
+
 # Initialize Redis
 redis_client = redis.Redis.from_url(REDIS_URL)
-def flush_keys_containing_pattern(pattern):
-    cursor = '0'
+def flush_keys_containing_pattern(pattern, count=1000, progress=None, keep_prefix=None):
+    """
+    Delete keys matching `pattern` with SCAN/UNLINK batches of about `count` keys.
+
+    Keys starting with `keep_prefix` are left alone. `progress(scanned,
+    deleted)` is called after every batch. Returns the totals as
+    (scanned, deleted).
+    """
+    cursor = 0
+    scanned = deleted = 0
+    keep = keep_prefix.encode('utf-8') if keep_prefix else None
     while True:
-        (count, keys) = redis_client.scan(cursor, match=pattern)
-        if count == 0:
+        cursor, keys = redis_client.scan(cursor, match=pattern, count=count)
+        scanned += len(keys)
+        if keep:
+            keys = [key for key in keys if not key.startswith(keep)]
+        if keys:
+            # UNLINK frees memory in a background thread on the Redis side
+            deleted += redis_client.unlink(*keys)
+        if progress:
+            progress(scanned, deleted)
+        if cursor == 0:
             break
-        if keys:  # Check if the keys list is not empty
-            for key in keys:
-                redis_client.delete(key)
-        cursor = keys[-1] if keys else ''  # Set cursor to an empty string if keys is empty
+    redis_client.publish(CACHE_INVALIDATION_CHANNEL, pattern)
     print(f"Flushed keys containing the pattern: {pattern}")
+    return scanned, deleted
 
-def flush_all():
-    redis_client.flushall()
-    print('flush all vals')
+def flush_all(count=1000, progress=None, keep_prefix=None):
+    """Delete every key of this database the same way, so the counts are reported too; returns (scanned, deleted)."""
+    return flush_keys_containing_pattern('*', count, progress, keep_prefix)
 
 # RabbitMQ connection
 params = pika.URLParameters(CLOUDAMQP_URL)
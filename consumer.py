@@ -4,15 +4,21 @@ import json
 import logging
 import time
 import random
+import functools
+import copy
+from concurrent.futures import ThreadPoolExecutor
 
-from config import params
+from config import params, CONSUMER_MODE, CONSUMER_PREFETCH_COUNT, CONSUMER_WORKERS, CONSUMER_POLL_INTERVAL, LLM_CONSUMER_WORKERS, LLM_CONSUMER_PREFETCH_COUNT, POCKETBASE_URL
 from processor import get_data_api, post_data_to_api, scrape_data
 from fetcher import fetch_and_cache,get_tags
 from pullpush import fetch_subreddit_posts
+from registry import controller_registry
+from metrics import metrics
+from tracing import tracer
 
 
 # Example usage:
-base_url = "https://stories-blog.pockethost.io"
+base_url = POCKETBASE_URL
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -31,13 +37,15 @@ def process_reddit_data(agent=None):
             subreddit["search_tags"] = search_tags
             subreddit["url_json_object"] = {**subreddit.get("url_json_object", {}), "tags": tags, "search_tags": search_tags}
             posts = fetch_subreddit_posts(subreddit)
+            tracer.mark(tracer.current(), 'listing')
             logging.debug(f"Fetched posts for subreddit {subreddit}")
         except Exception as e:
             logging.error(f"Error fetching subreddit posts: {e}:{subreddit}")
             return
 
+        post_objs = []
         for post in posts:
-            post_obj = [{
+            post_objs.append({
                 'link': f"{post.get('subreddit', '')}-{post.get('name', '')}-reddit-name",
                 'title': post.get('title', ''),
                 'image_links': [],
@@ -49,27 +57,28 @@ def process_reddit_data(agent=None):
                 }),
                 'processor': agent.get('id', ''),
                 'developer_id': agent.get('author_id', ''),
-                'author_id': agent.get('author_id', '')
-            }]
-            try:
-                post_data_to_api(post_obj)
-                logging.debug(f"Posted data to API for post: {post.get('title', '')}")
-            except Exception as e:
-                logging.error(f"Error posting data: {e}")
+                'author_id': agent.get('author_id', ''),
+                'trace': tracer.new(parent=tracer.current())
+            })
+        try:
+            post_data_to_api(post_objs)
+            logging.debug(f"Posted data to API for {len(post_objs)} posts")
+        except Exception as e:
+            logging.error(f"Error posting data: {e}")
 
 def data_scraper(scraper_id):
-    url = "https://stories-blog.pockethost.io/api/collections/scraper_controllers/records"
-    data = fetch_and_cache(url)
-    logging.debug(f"Fetched scraper configuration data: {data}")
-
-    if data:
-        for scraper_config in data['items']:
-            if scraper_config['source'] == "website" and scraper_config['id'] == scraper_id:
-                logging.debug(f"Starting website scraper for ID: {scraper_id}")
-                scrape_data(scraper_config)
-            elif scraper_config['source'] == "reddit" and scraper_config['id'] == scraper_id:
-                logging.debug(f"Starting Reddit scraper for ID: {scraper_id}")
-                process_reddit_data(scraper_config)
+    scraper_config = controller_registry.get(scraper_id)
+    logging.debug(f"Fetched scraper configuration data: {scraper_config}")
+
+    if scraper_config:
+        # The decoded config is shared through the in-process cache; scrapers mutate their copy
+        scraper_config = copy.deepcopy(scraper_config)
+        if scraper_config['source'] == "website":
+            logging.debug(f"Starting website scraper for ID: {scraper_id}")
+            scrape_data(scraper_config)
+        elif scraper_config['source'] == "reddit":
+            logging.debug(f"Starting Reddit scraper for ID: {scraper_id}")
+            process_reddit_data(scraper_config)
 
 def connect_to_rabbitmq(queue_name):
     while True:
@@ -84,39 +93,141 @@ def connect_to_rabbitmq(queue_name):
             logging.debug(f"Retrying connection in {RETRY_DELAY} seconds...")
             time.sleep(RETRY_DELAY)
 
-def data_to_process_consumer(consumer_running=True):
-    connection, channel = connect_to_rabbitmq('data_to_process_consumer')
-    
-    while consumer_running:
+def is_running(consumer_running):
+    """`consumer_running` is a plain flag or a threading.Event that is cleared to stop the consumer."""
+    if hasattr(consumer_running, 'is_set'):
+        return consumer_running.is_set()
+    return bool(consumer_running)
+
+def poll_queue(queue_name, handler, consumer_running=True, poll_interval=CONSUMER_POLL_INTERVAL):
+    """Pull messages one at a time with basic_get, sleeping while the queue is empty."""
+    connection, channel = connect_to_rabbitmq(queue_name)
+
+    while is_running(consumer_running):
         try:
-            method_frame, header_frame, body = channel.basic_get(queue='data_to_process_consumer')
+            method_frame, header_frame, body = channel.basic_get(queue=queue_name)
             if method_frame:
-                logging.debug(f"Received message: {body}")
-                get_data_api(body.decode('utf-8'))
+                logging.debug(f"Received {queue_name} message: {body}")
+                with tracer.activate(tracer.mark(tracer.from_properties(header_frame), f"queue:{queue_name}")):
+                    handler(body.decode('utf-8'))
                 channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-                logging.debug("Message acknowledged")
+                metrics.inc('amqp_messages_consumed_total', queue=queue_name, result='ok')
+                logging.debug(f"{queue_name} message acknowledged")
+            elif poll_interval:
+                time.sleep(poll_interval)
         except Exception as e:
-            logging.error(f"Error processing message: {e}")
-            connection, channel = connect_to_rabbitmq('data_to_process_consumer')
+            logging.error(f"Error processing {queue_name} message: {e}")
+            connection, channel = connect_to_rabbitmq(queue_name)
+
+def consume_queue(queue_name, handler, prefetch_count=CONSUMER_PREFETCH_COUNT, workers=CONSUMER_WORKERS, consumer_running=True):
+    """
+    Consume a queue with basic_consume and hand deliveries to a worker pool.
+
+    The broker pushes up to `prefetch_count` unacknowledged messages, so idle
+    workers cost nothing and busy ones already have their next deliveries
+    buffered locally. A message is acked from the connection thread once the
+    handler returns; if the handler raises or returns False it is requeued
+    once, then dropped on the second failure.
+
+    Clearing `consumer_running` (a threading.Event) stops the consumer:
+    deliveries not yet started are requeued and in-flight ones are settled
+    before the connection is closed.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{queue_name}-worker")
+    connection = None
+
+    while is_running(consumer_running):
+        connection, channel = connect_to_rabbitmq(queue_name)
+        channel.basic_qos(prefetch_count=max(prefetch_count, workers))
+
+        def settle(ch, delivery_tag, ok, redelivered):
+            if not ch.is_open:
+                return  # the broker redelivers unacked messages after a reconnect
+            if ok:
+                ch.basic_ack(delivery_tag=delivery_tag)
+                logging.debug(f"{queue_name} message acknowledged")
+            else:
+                if redelivered:
+                    logging.error(f"Dropping {queue_name} message after a second failure")
+                ch.basic_nack(delivery_tag=delivery_tag, requeue=not redelivered)
+
+        def work(ch, method, properties, body):
+            ok = True
+            try:
+                with tracer.activate(tracer.mark(tracer.from_properties(properties), f"queue:{queue_name}")):
+                    ok = handler(body.decode('utf-8')) is not False
+            except Exception as e:
+                logging.error(f"Error processing {queue_name} message: {e}")
+                ok = False
+            metrics.inc('amqp_messages_consumed_total', queue=queue_name, result='ok' if ok else 'failed')
+            try:
+                connection.add_callback_threadsafe(functools.partial(settle, ch, method.delivery_tag, ok, method.redelivered))
+            except Exception as e:
+                logging.error(f"Could not settle {queue_name} message: {e}")
+
+        def on_message(ch, method, properties, body):
+            if not is_running(consumer_running):
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                ch.stop_consuming()
+                return
+            logging.debug(f"Received {queue_name} message: {body}")
+            executor.submit(work, ch, method, properties, body)
+
+        def check_running():
+            # Runs on the connection thread, so an idle consumer notices the stop too
+            if is_running(consumer_running):
+                connection.call_later(1, check_running)
+            else:
+                channel.stop_consuming()
 
-def scraper_consumer(consumer_running=True):
-    connection, channel = connect_to_rabbitmq('scraper_consumer')
-    
-    while consumer_running:
         try:
-            method_frame, header_frame, body = channel.basic_get(queue='scraper_consumer')
-            if method_frame:
-                logging.debug(f"Received scraper message: {body}")
-                data_scraper(body.decode('utf-8'))
-                channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-                logging.debug("Scraper message acknowledged")
+            channel.basic_consume(queue=queue_name, on_message_callback=on_message)
+            connection.call_later(1, check_running)
+            channel.start_consuming()
         except Exception as e:
-            logging.error(f"Error processing scraper message: {e}")
-            connection, channel = connect_to_rabbitmq('scraper_consumer')
+            logging.error(f"Error consuming {queue_name}: {e}")
+            try:
+                connection.close()
+            except Exception:
+                pass
+            time.sleep(RETRY_DELAY)
 
-data_to_process_consumer_thread = threading.Thread(target=data_to_process_consumer)
-scraper_consumer_thread = threading.Thread(target=scraper_consumer)
+    # Stopped: let in-flight handlers finish, then deliver their acks before closing
+    executor.shutdown(wait=True)
+    try:
+        if connection is not None and connection.is_open:
+            connection.process_data_events(time_limit=0)
+            connection.close()
+    except Exception as e:
+        logging.error(f"Error closing {queue_name} consumer: {e}")
+    logging.info(f"{queue_name} consumer stopped")
+
+def run_consumer(queue_name, handler, consumer_running=True, prefetch_count=CONSUMER_PREFETCH_COUNT, workers=CONSUMER_WORKERS):
+    if CONSUMER_MODE == 'poll':
+        poll_queue(queue_name, handler, consumer_running)
+    else:
+        consume_queue(queue_name, handler, prefetch_count, workers, consumer_running)
 
-data_to_process_consumer_thread.start()
-scraper_consumer_thread.start()
+def data_to_process_consumer(consumer_running=True):
+    # Each article spends most of its time waiting on LLM responses, so keep many in flight
+    run_consumer('data_to_process_consumer', get_data_api, consumer_running, LLM_CONSUMER_PREFETCH_COUNT, LLM_CONSUMER_WORKERS)
 
+def scraper_consumer(consumer_running=True):
+    run_consumer('scraper_consumer', data_scraper, consumer_running)
+
+# Cleared by stop_consumers() to shut both consumers down
+consumers_running = threading.Event()
+
+def start_consumers():
+    consumers_running.set()
+    consumer_threads = [
+        threading.Thread(target=data_to_process_consumer, args=(consumers_running,), name="DataToProcessConsumerThread"),
+        threading.Thread(target=scraper_consumer, args=(consumers_running,), name="ScraperConsumerThread")
+    ]
+    for thread in consumer_threads:
+        thread.start()
+        logging.debug(f"Started {thread.name}")
+    return consumer_threads
+
+def stop_consumers():
+    consumers_running.clear()
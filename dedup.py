@@ -0,0 +1,21 @@
+from config import redis_client
+
+
+def seen(keys):
+    """Return the subset of `keys` already present in Redis, in one MGET round-trip."""
+    keys = [key for key in keys if key]
+    if not keys:
+        return set()
+    values = redis_client.mget(keys)
+    return {key for key, value in zip(keys, values) if value is not None}
+
+
+def mark(keys, expiration, value='1'):
+    """Set every key in `keys` to `value` with a TTL, in one pipelined round-trip."""
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.setex(key, expiration, value)
+    pipe.execute()
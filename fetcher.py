@@ -1,20 +1,32 @@
 ## fetcher.py
 import requests
+import http_client
 import json
 import logging
-from bs4 import BeautifulSoup
+import threading
+import hashlib
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4 import FeatureNotFound
 from urllib.parse import urljoin
-from config import redis_client, REDIS_CACHE_EXPIRATION
+from config import redis_client, REDIS_CACHE_EXPIRATION, LOCAL_CACHE_TTL, HTML_PARSER, HTTP_VALIDATOR_TTL, REMOTE_CODE_CACHE_TTL, POCKETBASE_URL
+from tiered_cache import local_cache
+from code_loader import compile_lambda
+from tag_index import tag_index
+from metrics import metrics
 
 import urllib.parse
 import random
 import time
-from cachetools import cached, TTLCache
+from cachetools import cached, TTLCache, LRUCache
 
 
 #logging.basicConfig(level=logging.DEBUG)
 
-cache = TTLCache(maxsize=128, ttl=300)  # 300 seconds = 5 minutes
+try:
+    BeautifulSoup('', HTML_PARSER)
+except FeatureNotFound:
+    logging.warning(f"HTML parser {HTML_PARSER} is not installed, falling back to html.parser")
+    HTML_PARSER = 'html.parser'
 
 
 
@@ -22,29 +34,185 @@ cache = TTLCache(maxsize=128, ttl=300)  # 300 seconds = 5 minutes
 
 
 
+redis_cache_stats = {'hits': 0, 'misses': 0}
+
 def fetch_and_cache(url, cache_expiration=REDIS_CACHE_EXPIRATION):
     cache_key = f"cache:{url}"
+    # local_cache counts its own hits and misses, at the point it decides
+    return local_cache.get(cache_key, lambda: fetch_through_redis(url, cache_key, cache_expiration),
+                           ttl=min(LOCAL_CACHE_TTL, cache_expiration))
+
+def fetch_through_redis(url, cache_key, cache_expiration):
     cached_value = redis_client.get(cache_key)
     if cached_value:
+        redis_cache_stats['hits'] += 1
+        metrics.inc('cache_requests_total', tier='redis', result='hit')
         return json.loads(cached_value)
+    redis_cache_stats['misses'] += 1
+    metrics.inc('cache_requests_total', tier='redis', result='miss')
 
-    response = requests.get(url)
-    if response.status_code == 200:
-        value = response.json()
-        if value is not None:
-            redis_client.setex(cache_key, cache_expiration, json.dumps(value))
-        return value
-    else:
-        return None
+    # Only one process refills from the origin; the others wait for the value to land in Redis
+    lock_key = f"lock:{cache_key}"
+    owner = redis_client.set(lock_key, 1, nx=True, ex=30)
+    if not owner:
+        for _ in range(50):
+            time.sleep(0.1)
+            cached_value = redis_client.get(cache_key)
+            if cached_value:
+                return json.loads(cached_value)
+
+    try:
+        response = http_client.get(url)
+        if response.status_code == 200:
+            value = response.json()
+            if value is not None:
+                redis_client.setex(cache_key, cache_expiration, json.dumps(value))
+            return value
+        else:
+            return None
+    finally:
+        if owner:
+            redis_client.delete(lock_key)
 
-def fetch_article_data(url, headers):
+# Returned instead of content/soup when a conditional fetch finds the page unchanged
+NOT_MODIFIED = object()
+
+def validators_key(controller_id, url, controller=None):
+    """
+    Redis key of the validators kept for `url` on behalf of one controller.
+
+    Controllers sharing a listing keep their own validators, and a change to
+    the controller's selectors changes the key, so the page is scanned again.
+    """
+    fingerprint = hashlib.sha1(json.dumps(controller, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f"http:validators:{controller_id}:{fingerprint}:{url}"
+
+def store_validators(key, validators):
+    """Keep validators returned by fetch_page, once the page has been fully processed."""
+    if not validators:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.delete(key)
+    pipe.hset(key, mapping=validators)
+    pipe.expire(key, HTTP_VALIDATOR_TTL)
+    pipe.execute()
+
+def fetch_page(url, headers, validators_key=None):
+    """
+    Fetch a page body, or None on error.
+
+    With a `validators_key`, the fetch is conditional: the ETag,
+    Last-Modified and body hash stored under that key are sent as
+    If-None-Match/If-Modified-Since, and (content, new validators) is
+    returned. The content is NOT_MODIFIED on a 304 or when the body hash is
+    unchanged. The new validators are not stored here; the caller passes
+    them to store_validators once it is done with the page.
+    """
+    validators = {}
+    if validators_key:
+        validators = {key.decode('utf-8'): value.decode('utf-8') for key, value in redis_client.hgetall(validators_key).items()}
+        headers = dict(headers)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
     try:
-        response = requests.get(url, headers=headers)
+        with metrics.timer('article_fetch_seconds'):
+            response = http_client.get(url, headers=headers)
+        if validators_key and response.status_code == 304:
+            return NOT_MODIFIED, None
         response.raise_for_status()
-        return BeautifulSoup(response.content, 'html.parser')
     except requests.RequestException as e:
         logging.error(f"Error fetching {url}: {e}")
-        return None
+        return (None, None) if validators_key else None
+
+    if not validators_key:
+        return response.content
+    digest = hashlib.sha1(response.content).hexdigest()
+    if digest == validators.get('hash'):
+        return NOT_MODIFIED, None
+    new_validators = {'hash': digest}
+    if response.headers.get('ETag'):
+        new_validators['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        new_validators['last_modified'] = response.headers['Last-Modified']
+    return response.content, new_validators
+
+def fetch_article_data(url, headers, plan=None, validators_key=None):
+    """
+    Fetch and parse a page.
+
+    Without a plan the whole document is parsed and a soup is returned. With
+    a ParsePlan only the subtrees its selector chains start from are parsed,
+    and a dict of chain name -> soup is returned. With a `validators_key`,
+    (soup, new validators) is returned as by fetch_page, and an unchanged
+    page gives NOT_MODIFIED without being parsed.
+    """
+    if not validators_key:
+        return parse_page(fetch_page(url, headers), plan)
+    content, validators = fetch_page(url, headers, validators_key)
+    return parse_page(content, plan), validators
+
+def parse_page(content, plan=None):
+    if content is None or content is NOT_MODIFIED:
+        return content
+    if plan is not None:
+        return plan.parse(content)
+    return BeautifulSoup(content, HTML_PARSER)
+
+def make_strainer(selector):
+    if len(selector) == 3:
+        tag, attr, value = selector
+        return SoupStrainer(tag, {attr: value})
+    return SoupStrainer(selector[0])
+
+class ParsePlan:
+    """
+    Selector chains of one controller, compiled once.
+
+    Each chain's first selector becomes a SoupStrainer, so a page is parsed
+    only as far as the chains need: the elements matching the first
+    selector and their descendants. The rest of each chain then runs
+    unchanged with find_element/find_elements on that reduced tree, giving
+    the same matches as on a full parse. Chains that share a first selector
+    share one parse.
+    """
+
+    def __init__(self, **chains):
+        self.chains = {name: [list(selector) for selector in chain] for name, chain in chains.items()}
+        self.strainers = {}
+        for chain in self.chains.values():
+            root = self.root_key(chain)
+            if root is not None and root not in self.strainers:
+                self.strainers[root] = make_strainer(chain[0])
+
+    @staticmethod
+    def root_key(chain):
+        return json.dumps(chain[0]) if chain else None
+
+    def parse(self, content):
+        soups = {}
+        parsed = {}
+        for name, chain in self.chains.items():
+            root = self.root_key(chain)
+            if root not in parsed:
+                parsed[root] = BeautifulSoup(content, HTML_PARSER, parse_only=self.strainers.get(root))
+            soups[name] = parsed[root]
+        return soups
+
+plan_cache = LRUCache(maxsize=256)
+plan_cache_lock = threading.Lock()
+
+def get_parse_plan(**chains):
+    """ParsePlan for these selector chains, compiled on first use."""
+    key = json.dumps(chains, sort_keys=True)
+    with plan_cache_lock:
+        plan = plan_cache.get(key)
+    if plan is None:
+        plan = ParsePlan(**chains)
+        with plan_cache_lock:
+            plan_cache[key] = plan
+    return plan
 
 def find_element(soup, selectors):
     for selector in selectors:
@@ -77,42 +245,9 @@ def find_elements(soup, selectors):
     return elements
 
 
-def get_tags(tags, base_url):
-    encoded_url = urllib.parse.quote_plus(str(tags))
-
-    def fetch_tags():
-        print (f"Cache miss: {tags}")
-        url = f"{base_url}/api/collections/view_articles_list/records"
-        filter_str = " || ".join(f"tags ?~ \"{tag}\"" for tag in tags)
-        filter_str = f"({filter_str})"
-        params = {
-            "page": 1,
-            "perPage": 50,
-            "filter": filter_str,
-            "sort": "-created",
-            "fields": "tags"
-        }
-        encoded_params = urllib.parse.urlencode(params, safe='()')
-        link = f"{url}?{encoded_params}"
-        response = requests.get(link)
-        if response.status_code == 200:
-            json_obj = response.json()
-            tags_list = []
-            for item in json_obj.get("items", []):
-                tags_list.append(item.get("tags", []))
-            random.shuffle(tags_list)
-            logging.debug(f"Cache hit: {tags}")
-            return tags_list if len(tags_list)>0 else [[tags]]  # return default pass tags if tags_list is empty
-        else:
-            return [[tags]]#"Error:", response.status_code
-
-    if encoded_url in cache:
-        res_tags = random.shuffle(cache[encoded_url])
-        return res_tags[:2]
-    else:
-        result = fetch_tags()
-        cache[encoded_url] = result
-        return result[:2]
+def get_tags(tags):
+    """Two random tag lists of recent articles with a tag containing one of `tags`, from the shared tag index."""
+    return tag_index.sample(tags, 2)[:2]
 
 
 
@@ -121,7 +256,7 @@ def get_tags(tags, base_url):
 #redis_client = redis.Redis(host='localhost', port=6379, db=0)
 
 # Base URL for fetching API endpoints and extraction logic
-BASE_URL = "https://stories-blog.pockethost.io"
+BASE_URL = POCKETBASE_URL
 
 # Fetch API endpoints and extraction logic from remote server
 def fetch_api_endpoints(key):
@@ -136,18 +271,18 @@ def fetch_api_endpoints(key):
     }
     encoded_params = urllib.parse.urlencode(params, safe='()')
     link = f"{url}?{encoded_params}"
-    response = requests.get(link)
-    if response.status_code == 200:
-        json_obj = response.json()
+    # Cached so each run doesn't pay a PocketBase round-trip; /flush or the TTL picks up edits
+    json_obj = fetch_and_cache(link, REMOTE_CODE_CACHE_TTL)
+    if json_obj is not None:
         return json_obj.get("items", [])
     else:
-        logging.error(f"Error fetching API endpoints: {response.status_code}")
+        logging.error(f"Error fetching API endpoints for {key}")
         return []
 
 # Fetch proxies from API endpoint
 def fetch_proxies_0(endpoint):
     try:
-        response = requests.get(endpoint['url'])
+        response = http_client.get(endpoint['url'])
         response.raise_for_status()
         proxies_list = endpoint['extract'](response)
         return proxies_list
@@ -159,7 +294,8 @@ def fetch_proxies_0(endpoint):
 def save_proxies(api_endpoints):
     proxies = []
     for endpoint in api_endpoints:
-        endpoint['extract'] = eval(f"lambda response: {endpoint['extract']}")
+        # Don't mutate the record: it is shared through the in-process cache
+        endpoint = {**endpoint, 'extract': compile_lambda(endpoint['extract'], globals())}
         proxies.extend(fetch_proxies_0(endpoint))
     redis_client.setex('proxies', 600, '\n'.join(proxies))  # save for 10 minutes
 
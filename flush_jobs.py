@@ -0,0 +1,61 @@
+import time
+import uuid
+import logging
+import threading
+
+from config import redis_client, flush_keys_containing_pattern, flush_all, FLUSH_SCAN_COUNT, FLUSH_JOB_TTL
+
+
+def _status_key(job_id):
+    return f"flush:job:{job_id}"
+
+
+def _update(job_id, **fields):
+    key = _status_key(job_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, FLUSH_JOB_TTL)
+    pipe.execute()
+
+
+def _run(job_id, pattern, started):
+    def progress(scanned, deleted):
+        _update(job_id, scanned=scanned, deleted=deleted, elapsed=time.time() - started)
+
+    # Job status hashes survive any pattern (e.g. '*' or 'flush:*'), so jobs can still report their progress
+    keep_prefix = _status_key('')
+    try:
+        if pattern is None:
+            scanned, deleted = flush_all(FLUSH_SCAN_COUNT, progress, keep_prefix=keep_prefix)
+        else:
+            scanned, deleted = flush_keys_containing_pattern(pattern, FLUSH_SCAN_COUNT, progress, keep_prefix=keep_prefix)
+        _update(job_id, state='done', scanned=scanned, deleted=deleted,
+                finished=time.time(), elapsed=time.time() - started)
+    except Exception as e:
+        logging.error(f"Flush job {job_id} failed: {e}")
+        _update(job_id, state='failed', error=str(e), elapsed=time.time() - started)
+
+
+def start_flush(pattern=None):
+    """Start flushing keys matching `pattern` (everything when None) in the background; returns the job id."""
+    job_id = uuid.uuid4().hex
+    started = time.time()
+    _update(job_id, pattern=pattern or '*', state='running', scanned=0, deleted=0, started=started, elapsed=0)
+    threading.Thread(target=_run, args=(job_id, pattern, started), name=f"FlushJob-{job_id[:8]}", daemon=True).start()
+    return job_id
+
+
+def get_status(job_id):
+    """Status fields of a flush job, or None if it is unknown or expired."""
+    status = redis_client.hgetall(_status_key(job_id))
+    if not status:
+        return None
+    status = {key.decode('utf-8'): value.decode('utf-8') for key, value in status.items()}
+    for field in ('scanned', 'deleted'):
+        if field in status:
+            status[field] = int(status[field])
+    for field in ('started', 'finished', 'elapsed'):
+        if field in status:
+            status[field] = float(status[field])
+    status['job_id'] = job_id
+    return status
@@ -1,5 +1,25 @@
-import requests
+import http_client
 import json
+from config import GEMINI_API_URL
+from rate_limiter import rate_limiter, estimate_tokens, provider_slot
+from metrics import metrics
+
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+DEFAULT_RETRY_DELAY = 30  # seconds to back off after a 429 that doesn't say how long
+
+def retry_delay(response):
+    """Seconds to wait after a 429: the Retry-After header, else the RetryInfo in the error body."""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        pass
+    try:
+        for detail in response.json().get('error', {}).get('details', []):
+            if detail.get('@type', '').endswith('RetryInfo') and detail.get('retryDelay'):
+                return float(detail['retryDelay'].rstrip('s'))
+    except (AttributeError, ValueError):
+        pass
+    return DEFAULT_RETRY_DELAY
 
 def get_text(json_data):
     text = None
@@ -10,7 +30,7 @@ def get_text(json_data):
     return text
     
 def gemini_generate_content(api_key, text):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
+    url = f"{GEMINI_API_URL}/models/{GEMINI_MODEL}:generateContent?key={api_key}"
     data = {
         "contents": [{
             "parts": [{
@@ -18,11 +38,16 @@ def gemini_generate_content(api_key, text):
             }]
         }]
     }
-    response = requests.post(url, headers={"Content-Type": "application/json"}, json=data)
+    rate_limiter.acquire('gemini', GEMINI_MODEL, estimate_tokens(text, max_tokens=1024))
+    with provider_slot('gemini'), metrics.timer('llm_request_seconds', provider='gemini', model=GEMINI_MODEL):
+        response = http_client.post(url, headers={"Content-Type": "application/json"}, json=data)
     if response.status_code == 200:
         json_data = response.json()
         return get_text(json_data)
     else:
+        if response.status_code == 429:
+            metrics.inc('llm_rate_limited_total', provider='gemini', model=GEMINI_MODEL)
+            rate_limiter.block('gemini', GEMINI_MODEL, retry_delay(response))
         return None
 
 
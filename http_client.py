@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_TIMEOUT, HTTP_PROXY_SESSIONS
+
+
+class HttpClient:
+    """
+    Pooled sessions for all outbound HTTP calls.
+
+    One requests.Session is kept per host so keep-alive connections are
+    reused across calls and threads. Idempotent requests are retried on
+    connection errors and 502/503/504.
+
+    Requests routed through a proxy get one session per proxy, without
+    retries (callers rotate proxies themselves) and without a cookie jar.
+    Only the `max_proxy_sessions` most recently used are kept; older ones are
+    closed, so cycling through thousands of proxies doesn't leak pools.
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR, timeout=HTTP_TIMEOUT,
+                 max_proxy_sessions=HTTP_PROXY_SESSIONS):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.max_proxy_sessions = max_proxy_sessions
+        self._sessions = {}  # (scheme, netloc) -> session
+        self._proxy_sessions = OrderedDict()  # proxies -> session, least recently used first
+        self._retired = {}  # stats key -> counts of sessions already closed
+        self._lock = threading.Lock()
+
+    def _new_session(self, retry):
+        retries = Retry(
+            total=self.max_retries if retry else 0,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, max_retries=retries)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def session_for(self, url):
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = self._sessions[key] = self._new_session(retry=True)
+        return session
+
+    def proxy_session_for(self, proxies):
+        key = tuple(sorted(proxies.items()))
+        evicted = []
+        with self._lock:
+            session = self._proxy_sessions.get(key)
+            if session is None:
+                session = self._proxy_sessions[key] = self._new_session(retry=False)
+                # Unrelated proxies and user agents must not share cookies
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                while len(self._proxy_sessions) > self.max_proxy_sessions:
+                    evicted.append(self._proxy_sessions.popitem(last=False)[1])
+            else:
+                self._proxy_sessions.move_to_end(key)
+            for old in evicted:
+                self._retire('proxied', old)
+        for old in evicted:
+            # Idle connections close now; ones still in use are closed when released
+            old.close()
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if kwargs.get('proxies'):
+            session = self.proxy_session_for(kwargs['proxies'])
+        else:
+            session = self.session_for(url)
+        return session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    @staticmethod
+    def _pool_counts(session):
+        requests_made = connections = 0
+        for adapter in set(session.adapters.values()):
+            for manager in [adapter.poolmanager] + list(adapter.proxy_manager.values()):
+                for pool_key in manager.pools.keys():
+                    pool = manager.pools.get(pool_key)
+                    if pool is not None:
+                        requests_made += pool.num_requests
+                        connections += pool.num_connections
+        return requests_made, connections
+
+    def _retire(self, key, session):
+        """Keep the counts of a session that is about to be closed. Call with the lock held."""
+        requests_made, connections = self._pool_counts(session)
+        entry = self._retired.setdefault(key, {'requests': 0, 'connections': 0})
+        entry['requests'] += requests_made
+        entry['connections'] += connections
+
+    def stats(self):
+        """Cumulative requests served vs connections opened per host ('proxied' for all proxied traffic)."""
+        with self._lock:
+            stats = {key: dict(entry) for key, entry in self._retired.items()}
+            sessions = [(netloc, session) for (_, netloc), session in self._sessions.items()]
+            sessions += [('proxied', session) for session in self._proxy_sessions.values()]
+        for key, session in sessions:
+            requests_made, connections = self._pool_counts(session)
+            entry = stats.setdefault(key, {'requests': 0, 'connections': 0})
+            entry['requests'] += requests_made
+            entry['connections'] += connections
+        for entry in stats.values():
+            requests_made = entry['requests']
+            entry['reuse_rate'] = 1 - entry['connections'] / requests_made if requests_made else 0.0
+        return stats
+
+
+client = HttpClient()
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return client.patch(url, **kwargs)
+
+
+def stats():
+    return client.stats()
@@ -1,7 +1,61 @@
-## json_utils.py
 import json
 import re
 
+_OBJECT_TOKENS = re.compile(r'["{}]')
+_ARRAY_TOKENS = re.compile(r'["\[\]]')
+
+
+def _find_opening(data, close_index, open_char, close_char, tokens):
+    """
+    Index of the bracket that opens the value ending at `close_index`, or -1.
+
+    Scans right to left over quotes and brackets only, skipping string
+    contents. A quote is a delimiter when preceded by an even number of
+    backslashes. Brackets of the other kind are ignored; they are balanced
+    inside any valid value anyway.
+    """
+    depth = 0
+    in_string = False
+    for match in reversed(list(tokens.finditer(data, 0, close_index + 1))):
+        char = match.group()
+        position = match.start()
+        if char == '"':
+            backslashes = 0
+            while position - backslashes - 1 >= 0 and data[position - backslashes - 1] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                in_string = not in_string
+        elif in_string:
+            continue
+        elif char == close_char:
+            depth += 1
+        elif char == open_char:
+            depth -= 1
+            if depth == 0:
+                return position
+    return -1
+
+
+def _extract_enclosed(data, open_char, close_char, tokens):
+    """
+    Parse the value that ends at the last `close_char` in `data`.
+
+    This is the earliest `open_char` from which the text up to the last
+    `close_char` is valid JSON, found in a single pass instead of retrying
+    json.loads from every opening bracket. Returns None if there is none.
+    """
+    last_close = data.rfind(close_char)
+    if last_close == -1:
+        return None
+    first_open = _find_opening(data, last_close, open_char, close_char, tokens)
+    if first_open == -1:
+        return None
+    try:
+        return json.loads(data[first_open:last_close + 1])
+    except json.JSONDecodeError:
+        return None
+
+
 def extract_json_data(data):
     """
     Extract JSON data from a string.
@@ -31,36 +85,14 @@ def extract_json_data(data):
 
     # Extract JSON objects from the string
     if not json_data:
-        first_open = -1
-        while True:
-            first_open = data.find('{', first_open + 1)
-            if first_open == -1:
-                break
-            first_close = data.rfind('}')
-            while first_close <= first_open:
-                first_close = data.rfind('}', 0, first_close)
-            candidate = data[first_open:first_close + 1]
-            try:
-                json_data = json.loads(candidate)
-                break
-            except json.JSONDecodeError:
-                first_close = data.rfind('}', 0, first_close)
+        enclosed = _extract_enclosed(data, '{', '}', _OBJECT_TOKENS)
+        if enclosed is not None:
+            json_data = enclosed
 
     # Extract JSON arrays from the string
     if not json_data:
-        first_open = -1
-        while True:
-            first_open = data.find('[', first_open + 1)
-            if first_open == -1:
-                break
-            first_close = data.rfind(']')
-            while first_close <= first_open:
-                first_close = data.rfind(']', 0, first_close)
-            candidate = data[first_open:first_close + 1]
-            try:
-                json_data = json.loads(candidate)
-                break
-            except json.JSONDecodeError:
-                first_close = data.rfind(']', 0, first_close)
+        enclosed = _extract_enclosed(data, '[', ']', _ARRAY_TOKENS)
+        if enclosed is not None:
+            json_data = enclosed
 
     return json_data
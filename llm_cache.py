@@ -0,0 +1,79 @@
+import json
+import zlib
+import hashlib
+import logging
+
+import redis
+from config import redis_client, LLM_CACHE_TTL
+from metrics import metrics
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM results in Redis.
+
+    Keys are a SHA-256 of (model, system prompt, input text), so a requeued
+    article, or the same content scraped under another link, reuses the
+    earlier generation without touching the provider or its rate limits.
+    Values are stored as zlib-compressed JSON. A TTL of 0 disables the cache.
+    """
+
+    def __init__(self, ttl=LLM_CACHE_TTL, prefix='llm:cache', level=6):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.level = level
+
+    def key(self, model, system_prompt, text):
+        digest = hashlib.sha256(json.dumps([model, system_prompt, text]).encode('utf-8')).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def _ttl(self, ttl):
+        """The cache's TTL, shortened to `ttl` for steps that pass one; 0 still disables everything."""
+        return self.ttl if ttl is None else min(ttl, self.ttl)
+
+    def get(self, step, model, system_prompt, text, ttl=None):
+        if not self._ttl(ttl):
+            return None
+        try:
+            value = redis_client.get(self.key(model, system_prompt, text))
+        except redis.exceptions.RedisError as e:
+            logging.error(f"LLM cache unavailable: {e}")
+            return None
+        metrics.inc('llm_cache_requests_total', step=step, result='hit' if value is not None else 'miss')
+        if value is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(value))
+        except (zlib.error, ValueError) as e:
+            logging.error(f"Ignoring corrupt LLM cache entry: {e}")
+            return None
+
+    def set(self, model, system_prompt, text, value, ttl=None):
+        ttl = self._ttl(ttl)
+        if not ttl:
+            return
+        try:
+            redis_client.setex(self.key(model, system_prompt, text), ttl,
+                               zlib.compress(json.dumps(value).encode('utf-8'), self.level))
+        except redis.exceptions.RedisError as e:
+            logging.error(f"LLM cache unavailable: {e}")
+
+    def cached(self, step, model, system_prompt, text, generate, ttl=None, refresh=False):
+        """
+        Return the cached result, or call `generate()` and cache what it returns unless it is empty.
+
+        `ttl` shortens the cache's TTL for this step. With `refresh` the
+        cached result is ignored and replaced by a new generation.
+        """
+        if refresh:
+            metrics.inc('llm_cache_requests_total', step=step, result='refresh')
+        else:
+            value = self.get(step, model, system_prompt, text, ttl)
+            if value is not None:
+                return value
+        value = generate()
+        if value:
+            self.set(model, system_prompt, text, value, ttl)
+        return value
+
+llm_cache = LLMCache()
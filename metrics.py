@@ -0,0 +1,154 @@
+import json
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+from config import redis_client, METRICS_FLUSH_INTERVAL
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+# name -> (type, help)
+DESCRIPTIONS = {
+    'amqp_messages_consumed_total': ('counter', 'Messages taken off a queue, by queue and outcome'),
+    'article_fetch_seconds': ('histogram', 'Time to download a scraped page'),
+    'generate_content_seconds': ('histogram', 'End-to-end generate_content latency by model'),
+    'llm_request_seconds': ('histogram', 'Latency of single LLM HTTP requests by provider and model'),
+    'llm_rate_limited_total': ('counter', 'LLM responses with HTTP 429 by provider and model'),
+    'cache_requests_total': ('counter', 'fetch_and_cache lookups by tier and result'),
+    'llm_cache_requests_total': ('counter', 'LLM response cache lookups by generation step and result'),
+    'proxy_requests_total': ('counter', 'Proxied requests by result'),
+}
+
+
+class Metrics:
+    """
+    Low-overhead counters and histograms, aggregated across workers in Redis.
+
+    Updates only touch in-process dicts. A background thread adds the deltas
+    to Redis hashes every `flush_interval` seconds, and render() returns the
+    totals of all workers in the Prometheus text format.
+    """
+
+    def __init__(self, flush_interval=METRICS_FLUSH_INTERVAL, prefix='metrics'):
+        self.flush_interval = flush_interval
+        self.counters_key = f"{prefix}:counters"
+        self.histograms_key = f"{prefix}:histograms"
+        self._counters = defaultdict(float)
+        self._histograms = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @staticmethod
+    def _field(name, labels, *extra):
+        return json.dumps([name, sorted(labels.items()), *extra])
+
+    def inc(self, name, value=1, **labels):
+        self._ensure_flusher()
+        field = self._field(name, labels)
+        with self._lock:
+            self._counters[field] += value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        self._ensure_flusher()
+        with self._lock:
+            # Touch every bucket so the exposed series is complete from the first sample
+            for bound in buckets:
+                self._histograms[self._field(name, labels, 'bucket', '+Inf' if bound == math.inf else bound)] += value <= bound
+            self._histograms[self._field(name, labels, 'sum')] += value
+            self._histograms[self._field(name, labels, 'count')] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self):
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            histograms, self._histograms = self._histograms, defaultdict(float)
+        if not counters and not histograms:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for field, value in counters.items():
+                pipe.hincrbyfloat(self.counters_key, field, value)
+            for field, value in histograms.items():
+                pipe.hincrbyfloat(self.histograms_key, field, value)
+            pipe.execute()
+        except Exception as e:
+            logging.error(f"Error flushing metrics: {e}")
+            # Keep the deltas for the next attempt
+            with self._lock:
+                for field, value in counters.items():
+                    self._counters[field] += value
+                for field, value in histograms.items():
+                    self._histograms[field] += value
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="MetricsFlusher", daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def render(self):
+        """Prometheus exposition text for the totals of every worker."""
+        self.flush()
+        series = defaultdict(list)
+        for field, value in redis_client.hgetall(self.counters_key).items():
+            name, labels = json.loads(field)
+            series[name].append((name, labels, float(value)))
+        for field, value in redis_client.hgetall(self.histograms_key).items():
+            name, labels, kind, *bound = json.loads(field)
+            if kind == 'bucket':
+                series[name].append((f"{name}_bucket", labels + [['le', str(bound[0])]], float(value)))
+            else:
+                series[name].append((f"{name}_{kind}", labels, float(value)))
+
+        lines = []
+        for name in sorted(series):
+            metric_type, help_text = DESCRIPTIONS.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in sorted(series[name], key=_sample_order):
+                label_text = ','.join(f'{key}="{_escape(value_)}"' for key, value_ in labels)
+                value = _format_value(value)
+                lines.append(f"{sample_name}{{{label_text}}} {value}" if label_text else f"{sample_name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    """Sample value at full precision; `:g` would round large counters to 6 significant digits."""
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample_order(sample):
+    sample_name, labels, _ = sample
+    le = dict(labels).get('le')
+    bound = math.inf if le in (None, '+Inf') else float(le)
+    return (sample_name, [label for label in labels if label[0] != 'le'], bound)
+
+
+metrics = Metrics()
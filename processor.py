@@ -2,17 +2,27 @@
 
 import json
 import requests
+import http_client
 import logging
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from datetime import datetime
 import pika
-from config import GROQ_API_KEY, GEMINI_API_KEY, HEADERS_TO_POST, TEMP_API_URL, params, redis_client
-from fetcher import fetch_and_cache, fetch_article_data, find_element, find_elements
+from config import GROQ_API_KEY, GEMINI_API_KEY, HEADERS_TO_POST, TEMP_API_URL, POCKETBASE_URL, GROQ_API_URL, SCRAPE_MAX_WORKERS, SCRAPE_PER_HOST_LIMIT, INGEST_BATCH_SIZE, INGEST_WINDOW, INGEST_CONCURRENCY, PB_BATCH_API, LLM_CONTENT_CACHE_TTL, params, redis_client
+from fetcher import fetch_and_cache, fetch_article_data, find_element, find_elements, get_parse_plan, NOT_MODIFIED, store_validators, validators_key
 from json_utils import extract_json_data
 from gemini import gemini_generate_content
+from publisher import publisher
+import dedup
+from registry import controller_registry
+from rate_limiter import rate_limiter, estimate_tokens, provider_slot
+from metrics import metrics
+from tracing import tracer
+from llm_cache import llm_cache
 
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
 import re
 
@@ -53,11 +63,15 @@ def process_text(text, length):
     
 
 
-def generate_title_summary_tags(content, system_prompt_tst, model=None):
+def generate_title_summary_tags(content, system_prompt_tst, model=None, refresh=False):
     print('gen tags called')
     if not model:
       model="gemma-7b-it"
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    return llm_cache.cached('title_summary_tags', model, system_prompt_tst, content,
+                            lambda: request_title_summary_tags(content, system_prompt_tst, model), refresh=refresh)
+
+def request_title_summary_tags(content, system_prompt_tst, model):
+    url = GROQ_API_URL
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {GROQ_API_KEY}"
@@ -75,33 +89,37 @@ def generate_title_summary_tags(content, system_prompt_tst, model=None):
     }
 
     while True:
-        response = requests.post(url, headers=headers, json=data)
+        rate_limiter.acquire('groq', model, estimate_tokens(system_prompt_tst, content, max_tokens=data['max_tokens']))
+        with provider_slot('groq'), metrics.timer('llm_request_seconds', provider='groq', model=model):
+            response = http_client.post(url, headers=headers, json=data)
         if response.status_code == 200:
             content_ = response.json()['choices'][0]['message']['content']
             jsonData = extract_json_data(content_)
             if jsonData.get('title') or jsonData.get('summary') or jsonData.get('tags'):
                 return jsonData
+        elif response.status_code == 429:
+            metrics.inc('llm_rate_limited_total', provider='groq', model=model)
+            rate_limiter.block('groq', model, extract_time(response.headers.get("x-ratelimit-reset-requests", "1s")))
         else:
             time.sleep(1)
 
 def get_dynamic_content_controller(key, value):
-    url = "https://stories-blog.pockethost.io/api/collections/scraper_controllers/records"
-    data = fetch_and_cache(url,1200)
-    return next((item for item in data['items'] if item.get(key) == value), None)
+    return controller_registry.find(key, value)
 
 
 
 """process with ai logic"""
 
-MAX_CALLS = 20
-PERIOD = 1
-last_call_time = time.time()
-call_count = 0
+def process_with_groq_api(article, model="mixtral-8x7b-32768", change_model=True, reprocess=False):
+    """
+    Generate and post the AI version of a scrape_data record.
 
-def process_with_groq_api(article, model="mixtral-8x7b-32768", change_model=True):
+    With `reprocess`, or a truthy `reprocess` field on the record, cached
+    LLM results are ignored and regenerated.
+    """
     logging.info('process_with_groq_api called')
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    url = GROQ_API_URL
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {GROQ_API_KEY}"
@@ -120,50 +138,55 @@ def process_with_groq_api(article, model="mixtral-8x7b-32768", change_model=True
         return
 
     current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ai_content_system_prompt = processor['ai_content_system_prompt'].replace("___DATETIME___", current_datetime)
+    prompt_template = processor['ai_content_system_prompt']
+    ai_content_system_prompt = prompt_template.replace("___DATETIME___", current_datetime)
     text_context = article['data'].get("content")
     if change_model:
         model = processor.get('model', model)
 
-    content = generate_content(model, text_context, ai_content_system_prompt,headers)
+    reprocess = reprocess or bool(article.get('reprocess'))
+
+    trace = tracer.current()
+    # Keyed on the prompt template: the timestamp in the prompt would make every key unique.
+    # The result still reflects the date it was generated on, hence the short LLM_CONTENT_CACHE_TTL
+    with metrics.timer('generate_content_seconds', model=model):
+        content = llm_cache.cached('generate_content', model, prompt_template, text_context,
+                                   lambda: generate_content(model, text_context, ai_content_system_prompt, headers),
+                                   ttl=LLM_CONTENT_CACHE_TTL, refresh=reprocess)
+    tracer.mark(trace, 'generate_content')
 
     if content:
         system_prompt_tst = processor['ai_tst_system_prompt']
         model_tst = processor['tst_model']
-        json_data = generate_title_summary_tags(content, system_prompt_tst,model_tst)
+        json_data = generate_title_summary_tags(content, system_prompt_tst,model_tst, refresh=reprocess)
+        tracer.mark(trace, 'title_summary_tags')
         payload = create_payload(article, processor, content, json_data)
-        post_data(payload)
+        posted = post_data(payload)
+        tracer.mark(trace, 'post')
+        tracer.finish(trace, 'ok' if posted else 'failed', record_id=article['id'], link=article.get('link'))
+        return posted
     else:
       id_ = article["id"]
       trial_times = article.get("trial_times",0)
-      base_url = "https://full-bit.pockethost.io"
-      url = f"{base_url}/api/collections/scrape_data/records/{id_}"
+      url = f"{TEMP_API_URL}/{id_}"
       payload = {"failed_to_process": True,"trial_times":trial_times+1}
       headers = {"Content-Type": "application/json"}
       
-      response = requests.patch(url, json=payload, headers=headers)
+      response = http_client.patch(url, json=payload, headers=headers)
       
       if response.status_code == 200:
         print("Record updated successfully!")
       else:
         print("Error updating record:", response.text)
       if trial_times < 2:
-        producer([id_],q='data_to_process_consumer')
+        producer([id_],q='data_to_process_consumer', traces=[trace])
+      else:
+        tracer.finish(trace, 'failed', record_id=id_, link=article.get('link'))
 
 def make_api_call(url, headers, data):
-    global last_call_time, call_count
-    current_time = time.time()
-    if current_time - last_call_time < PERIOD:
-        call_count += 1
-        if call_count >= MAX_CALLS:
-            time.sleep(PERIOD - (current_time - last_call_time))
-            last_call_time = time.time()
-            call_count = 0
-    else:
-        last_call_time = current_time
-        call_count = 0
-
-    response = requests.post(url, headers=headers, json=data)
+    text = ' '.join(message.get('content', '') for message in data.get('messages', []))
+    rate_limiter.acquire('groq', data.get('model'), estimate_tokens(text, max_tokens=data.get('max_tokens', 0)))
+    response = http_client.post(url, headers=headers, json=data)
     response.raise_for_status()
     return response
 
@@ -193,15 +216,22 @@ def generate_content(model, text_context, ai_content_system_prompt, headers):
             "stream": False
         }
         try:
-          url="""https://api.groq.com/openai/v1/chat/completions"""
+          url=GROQ_API_URL
           for _ in range(5):
-            response = requests.post(url, headers=headers, json=data)
+            rate_limiter.acquire('groq', model, estimate_tokens(ai_content_system_prompt, text_context, max_tokens=data['max_tokens']))
+            with provider_slot('groq'), metrics.timer('llm_request_seconds', provider='groq', model=model):
+              response = http_client.post(url, headers=headers, json=data)
             if response.status_code == 200:
               res_content = response.json()['choices'][0]['message']['content']
               if res_content and len(res_content.split()) > 300:
                 return res_content
               else:
                 time.sleep(10)
+            elif response.status_code == 429:
+              # Let every caller of this bucket back off, not just this thread
+              metrics.inc('llm_rate_limited_total', provider='groq', model=model)
+              t = extract_time(response.headers.get("x-ratelimit-reset-requests", "10s"))
+              rate_limiter.block('groq', model, t)
             else:
               t = response.headers["x-ratelimit-reset-requests"] if response.headers else response.text
               t = extract_time(str(t))
@@ -229,47 +259,48 @@ def create_payload(article, processor, content, json_data):
     }
 
 def post_data(payload):
-    api_url = 'https://stories-blog.pockethost.io/api/collections/articles/records'
+    """Post a processed article; returns False only if every attempt failed."""
+    api_url = f'{POCKETBASE_URL}/api/collections/articles/records'
     for _ in range(3):
         try:
           if payload["content"] and len(payload["content"]) > 500:
-            response = requests.post(api_url, json=payload, headers=HEADERS_TO_POST)
+            response = http_client.post(api_url, json=payload, headers=HEADERS_TO_POST)
             response.raise_for_status()
             logging.info("Data posted successfully for AI")
-            break
+            return True
           else:
-            break
+            return True
         except requests.RequestException as e:
             logging.error(f"Error posting data for AI: {e}")
     else:
         logging.error("Failed to post data for AI after 3 attempts")
+        return False
 
 """end process with ai logic"""
 
 
         
 
-def producer(data,q='hello'):
-    connection = pika.BlockingConnection(params)
-    channel = connection.channel()
-    channel.queue_declare(queue=q)
-
-    for item in data:
-        channel.basic_publish(exchange='', routing_key=q, body=item)
-
+def producer(data,q='hello',traces=None):
+    properties = [tracer.properties(trace) for trace in traces] if traces else None
+    publisher.publish(q, data, properties)
     logging.info(f"Sent {len(data)} {q} messages")
-    connection.close()
 
 def get_data_api(article_id):
     try:
-        response = requests.get(f"{TEMP_API_URL}/{article_id}", headers=HEADERS_TO_POST)
+        response = http_client.get(f"{TEMP_API_URL}/{article_id}", headers=HEADERS_TO_POST)
         response.raise_for_status()
         if response.status_code == 200:
             data = response.json()
             if data.get('id'):
-                process_with_groq_api(data)
+                # The record carries the trace as of ingest, for messages published without one
+                trace = tracer.current() or (data.get('data') or {}).get('trace')
+                with tracer.activate(tracer.mark(trace, 'load')):
+                    return process_with_groq_api(data)
     except requests.RequestException as e:
-        logging.error(f"Error posting data for link {article_id}: {e}")
+        logging.error(f"Error loading record {article_id}: {e}")
+        # Not acked: the message is requeued once, like other failures
+        return False
 
 
 
@@ -296,84 +327,312 @@ def consumer(consumer_running=True):
 
 
 
+batch_api_available = None if PB_BATCH_API == 'auto' else False
+
+def post_records_batch_api(payloads):
+    """
+    Create records through PocketBase's batch API in one request.
+
+    Returns a list of record ids (None where a record failed), or None if
+    the server doesn't offer the batch API, which is then not tried again.
+    """
+    global batch_api_available
+    base_url, _, collection_path = TEMP_API_URL.partition('/api/')
+    body = {"requests": [{"method": "POST", "url": f"/api/{collection_path}", "body": payload} for payload in payloads]}
+    response = http_client.post(f"{base_url}/api/batch", json=body, headers=HEADERS_TO_POST)
+    if response.status_code in (403, 404):
+        logging.info("PocketBase batch API not available, posting records concurrently")
+        batch_api_available = False
+        return None
+    response.raise_for_status()
+    batch_api_available = True
+    return [(result.get('body') or {}).get('id') if result.get('status') == 200 else None for result in response.json()]
+
+def post_record(payload):
+    response = http_client.post(TEMP_API_URL, json=payload, headers=HEADERS_TO_POST)
+    response.raise_for_status()
+    return response.json().get('id') if response.status_code == 200 else None
+
+def post_records_concurrently(payloads):
+    def post(payload):
+        try:
+            return post_record(payload)
+        except requests.RequestException as e:
+            logging.error(f"Error posting data for link {payload['link']}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY) as executor:
+        return list(executor.map(post, payloads))
+
 def post_data_to_api(data):
+    """Post scraped articles to TEMP_API_URL and enqueue all created ids in one publish."""
+    posted_links = dedup.seen(article.get('link') for article in data)
+    payloads = []
+    batch_links = set()
     for article in data:
         link = article.get('link')
-        if redis_client.exists(link):
+        if link in posted_links or link in batch_links:
             logging.info(f"Link {link} already posted, skipping...")
             continue
-        payload = {
+        batch_links.add(link)
+        payloads.append({
             'data': article,
             'link': link
-        }
+        })
+    if not payloads:
+        return []
+
+    data_ids = []
+    remaining = payloads
+    while remaining and batch_api_available is not False:
+        chunk = remaining[:INGEST_BATCH_SIZE]
         try:
-            response = requests.post(TEMP_API_URL, json=payload, headers=HEADERS_TO_POST)
-            response.raise_for_status()
-            logging.info(f"Data posted successfully for link: {link}")
-            redis_client.setex(link, 3600, "posted")
-            if response.status_code == 200:
-                data_id = response.json()['id']
-                producer([data_id],'data_to_process_consumer')
-            time.sleep(0.1)
+            chunk_ids = post_records_batch_api(chunk)
+        except requests.exceptions.ConnectTimeout as e:
+            # The batch never reached the server, so its records can be posted one by one
+            logging.error(f"Error connecting to post batch of {len(chunk)} records: {e}")
+            break
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and 400 <= status < 500:
+                # A definite rejection: the transaction committed nothing, usually because of
+                # one invalid record, so post the chunk one by one and lose only the bad ones
+                logging.error(f"Batch of {len(chunk)} records rejected ({status}), posting them one by one: {e}")
+                chunk_ids = post_records_concurrently(chunk)
+            else:
+                # A 5xx may come from a proxy after the server committed the batch
+                logging.error(f"Error posting batch of {len(chunk)} records: {e}")
+                chunk_ids = [None] * len(chunk)
         except requests.RequestException as e:
-            logging.error(f"Error posting data for link {link}: {e}")
-            redis_client.setex(link, 3600, 'posted')
+            # The server may have committed the batch (e.g. a read timeout or a dropped
+            # connection), so retrying could create every record twice; the links are
+            # marked and skipped instead
+            logging.error(f"Error posting batch of {len(chunk)} records: {e}")
+            chunk_ids = [None] * len(chunk)
+        if chunk_ids is None:
+            break
+        data_ids.extend(chunk_ids)
+        remaining = remaining[INGEST_BATCH_SIZE:]
+    if remaining:
+        data_ids.extend(post_records_concurrently(remaining))
+
+    # Marked before publishing, so a failed publish can't get created records posted again.
+    # Failed links are marked too, as before, so a broken record isn't retried every scan
+    dedup.mark((payload['link'] for payload in payloads), 3600, 'posted')
+    for payload, data_id in zip(payloads, data_ids):
+        if data_id:
+            logging.info(f"Data posted successfully for link: {payload['link']}")
+    traces = []
+    for payload, data_id in zip(payloads, data_ids):
+        if data_id:
+            traces.append(tracer.mark(payload['data'].get('trace'), 'ingest'))
+    data_ids = [data_id for data_id in data_ids if data_id]
+    if data_ids:
+        producer(data_ids, 'data_to_process_consumer', traces=traces)
+    return data_ids
+
+class BulkIngester:
+    """
+    Buffers scraped articles and hands them to post_data_to_api in batches.
+
+    A batch is sent once it reaches `batch_size` articles or once the oldest
+    buffered article has waited `window` seconds, whichever comes first.
+    Batches are sent on the caller's thread, so publishing reuses its AMQP
+    connection: the window is checked in add() and flush_due(), and the
+    caller waits at most timeout() seconds between calls.
+    """
+
+    def __init__(self, batch_size=INGEST_BATCH_SIZE, window=INGEST_WINDOW):
+        self.batch_size = batch_size
+        self.window = window
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self.failures = 0
+
+    def add(self, article):
+        with self._lock:
+            self._buffer.append(article)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            batch = self._take() if len(self._buffer) >= self.batch_size or self._expired() else None
+        if batch:
+            self._send(batch)
+
+    def _expired(self):
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.window
+
+    def _take(self):
+        batch, self._buffer = self._buffer, []
+        self._oldest = None
+        return batch
+
+    def _send(self, batch):
+        try:
+            post_data_to_api(batch)
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Error ingesting batch of {len(batch)} articles: {e}")
+
+    def timeout(self):
+        """Seconds until the buffered batch is due, or None when nothing is buffered."""
+        with self._lock:
+            if self._oldest is None:
+                return None
+            return max(0.0, self.window - (time.monotonic() - self._oldest))
+
+    def flush_due(self):
+        """Send the buffered batch if its window has passed."""
+        with self._lock:
+            batch = self._take() if self._expired() else None
+        if batch:
+            self._send(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def host_slot(url):
+    """Semaphore capping concurrent requests to the host of `url`."""
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(SCRAPE_PER_HOST_LIMIT)
+    return slot
+
+# Article fetches of every scrape_data call in the process share these threads
+scrape_executor = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix="scrape")
+
+def submit_scrape(link_href, *args):
+    """
+    Run scrape_article on the shared executor once the host of `link_href` has a free slot.
+
+    The slot is taken by the caller before submitting, so pool threads never
+    sit idle waiting for a busy host, and is released when the task is done.
+    """
+    slot = host_slot(link_href)
+    slot.acquire()
+    try:
+        future = scrape_executor.submit(scrape_article, link_href, *args)
+    except BaseException:
+        slot.release()
+        raise
+    future.add_done_callback(lambda _: slot.release())
+    return future
+
+def scrape_article(link_href, scrape_configuration, headers, job_trace=None):
+    scrape_config = scrape_configuration['controller']
+    plan = get_parse_plan(title=scrape_config['title']['selector'], content=scrape_config['visit']['content']['selector'])
+    article_soups = fetch_article_data(link_href, headers, plan)
+    if article_soups is None:
+        return None
+
+    title_element = find_element(article_soups['title'], scrape_config['title']['selector'])
+    title = title_element.text.strip() if title_element else None
+    content_element = find_element(article_soups['content'], scrape_config['visit']['content']['selector'])
+    content = content_element.text.strip() if content_element else None
+
+    image_links = set()
+    if content_element:
+        for img in content_element.find_all('img'):
+            img_src = img.get('src')
+            if img_src and not img_src.startswith('http'):
+                img_src = urljoin(link_href, img_src)
+            image_links.add(img_src)
 
-def scrape_data(scrape_configuration):
+    return {
+        'link': link_href,
+        'title': title,
+        'image_links': list(image_links),
+        'content': content,
+        'processor': scrape_configuration['id'],
+        'developer_id': scrape_configuration['author_id'],
+        'author_id': scrape_configuration['author_id'],
+        'trace': tracer.mark(tracer.new(parent=job_trace), 'fetch')
+    }
+
+def scrape_data(scrape_configuration, max_workers=SCRAPE_MAX_WORKERS):
     results = []
     scrape_config = scrape_configuration['controller']
     link = scrape_config['main_link']
     headers = {'User-Agent': 'Mozilla/5.0'}
-    soup = fetch_article_data(link, headers)
+    plan = get_parse_plan(link=scrape_config['link']['selector'])
+    listing_key = validators_key(scrape_configuration['id'], link, scrape_config)
+    soups, validators = fetch_article_data(link, headers, plan, validators_key=listing_key)
 
-    if soup is None:
+    if soups is None:
+        return results
+    if soups is NOT_MODIFIED:
+        logging.info(f"Listing {link} unchanged since the last scan, skipping...")
         return results
 
-    link_elements = find_elements(soup, scrape_config['link']['selector'])
+    link_elements = find_elements(soups['link'], scrape_config['link']['selector'])
     unique_links = set()
+    article_links = []
 
     for link_element in link_elements:
         link_href = link_element.get('href')
         if link_href:
             if not link_href.startswith('http'):
                 link_href = urljoin(link, link_href)
-            if link_href in unique_links or redis_client.exists(link_href):
-                print(f"Link {link_href} already processed, skipping...")
+            if link_href in unique_links:
                 continue
 
             unique_links.add(link_href)
-            article_soup = fetch_article_data(link_href, headers)
-            if article_soup is None:
+            article_links.append(link_href)
+
+    # One round-trip for the whole listing instead of one EXISTS per link
+    processed_links = dedup.seen(article_links)
+    for link_href in processed_links:
+        print(f"Link {link_href} already processed, skipping...")
+    article_links = [link_href for link_href in article_links if link_href not in processed_links]
+    job_trace = tracer.mark(tracer.current(), 'listing')
+
+    # Fetch and parse articles on the shared scrape executor, at most `max_workers` of this
+    # listing at a time, posting them in small batches as they are ready
+    ingester = BulkIngester()
+    errors = 0
+    links = iter(article_links)
+    pending = set()
+    while True:
+        while len(pending) < max_workers:
+            link_href = next(links, None)
+            if link_href is None:
+                break
+            pending.add(submit_scrape(link_href, scrape_configuration, headers, job_trace))
+        if not pending:
+            break
+        done, pending = wait(pending, timeout=ingester.timeout(), return_when=FIRST_COMPLETED)
+        ingester.flush_due()
+        for future in done:
+            try:
+                obj = future.result()
+            except Exception as e:
+                logging.error(f"Error scraping article: {e}")
+                errors += 1
+                continue
+            if obj is None:
+                errors += 1
                 continue
-
-            title_element = find_element(article_soup, scrape_config['title']['selector'])
-            title = title_element.text.strip() if title_element else None
-            content_element = find_element(article_soup, scrape_config['visit']['content']['selector'])
-            content = content_element.text.strip() if content_element else None
-
-            image_links = set()
-            if content_element:
-                for img in content_element.find_all('img'):
-                    img_src = img.get('src')
-                    if img_src and not img_src.startswith('http'):
-                        img_src = urljoin(link_href, img_src)
-                    image_links.add(img_src)
-
-            obj = {
-                'link': link_href,
-                'title': title,
-                'image_links': list(image_links),
-                'content': content,
-                'processor': scrape_configuration['id'],
-                'developer_id': scrape_configuration['author_id'],
-                'author_id': scrape_configuration['author_id']
-            }
             #print(obj)
-            if content and len(content) > 200:
+            if obj['content'] and len(obj['content']) > 200:
                 results.append(obj)
                 logging.info(f"Scraped data: {obj['title']}")
-                post_data_to_api([obj])
+                ingester.add(obj)
             else:
                 logging.info("Content is too short, skipping...")
                 redis_client.setex(obj['link'], 7200, 'ban')
+    ingester.flush()
+
+    # Only a fully processed listing may be skipped next time
+    if errors or ingester.failures:
+        logging.warning(f"Listing {link} had {errors} article errors and {ingester.failures} failed batches, it will be scanned again")
+    else:
+        store_validators(listing_key, validators)
     return results
@@ -1,16 +1,24 @@
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+import aiohttp
+import errno
+import resource
 import requests
+import http_client
 import time
 import logging
 import json
 import urllib.parse
 from cachetools import cached, TTLCache
-from config import redis_client
+from config import redis_client, REMOTE_CODE_CACHE_TTL, POCKETBASE_URL, PROXY_TEST_URL
+from fetcher import fetch_and_cache
+from code_loader import compile_lambda
+from proxy_health import proxy_tracker
 
 
 # Base URL for fetching API endpoints and extraction logic
-BASE_URL = "https://stories-blog.pockethost.io"
+BASE_URL = POCKETBASE_URL
 
 # Fetch API endpoints and extraction logic from remote server
 def fetch_api_endpoints(key):
@@ -25,18 +33,18 @@ def fetch_api_endpoints(key):
     }
     encoded_params = urllib.parse.urlencode(params, safe='()')
     link = f"{url}?{encoded_params}"
-    response = requests.get(link)
-    if response.status_code == 200:
-        json_obj = response.json()
+    # Cached so each run doesn't pay a PocketBase round-trip; /flush or the TTL picks up edits
+    json_obj = fetch_and_cache(link, REMOTE_CODE_CACHE_TTL)
+    if json_obj is not None:
         return json_obj.get("items", [])
     else:
-        logging.error(f"Error fetching API endpoints: {response.status_code}")
+        logging.error(f"Error fetching API endpoints for {key}")
         return []
 
 # Fetch proxies from API endpoint
 def fetch_proxies_0(endpoint):
     try:
-        response = requests.get(endpoint['url'])
+        response = http_client.get(endpoint['url'])
         response.raise_for_status()
         proxies_list = endpoint['extract'](response)
         return proxies_list
@@ -48,7 +56,8 @@ def fetch_proxies_0(endpoint):
 def save_proxies(api_endpoints):
     proxies = []
     for endpoint in api_endpoints:
-        endpoint['extract'] = eval(f"lambda response: {endpoint['extract']}")
+        # Don't mutate the record: it is shared through the in-process cache
+        endpoint = {**endpoint, 'extract': compile_lambda(endpoint['extract'], globals())}
         proxies.extend(fetch_proxies_0(endpoint))
     redis_client.setex('proxies', 3600, '\n'.join(proxies))  # save for 10 minutes
 
@@ -90,7 +99,7 @@ def fetch_proxies():
 redis_key = 'fastest_proxies'
 
 # Test URL
-test_url = 'https://httpbin.org/get'
+test_url = PROXY_TEST_URL
 
 # Maximum number of threads
 max_threads = 100
@@ -101,7 +110,7 @@ max_response_time = 5
 def test_proxy(proxy):
     try:
         start_time = time.time()
-        response = requests.get(test_url, proxies={"http": proxy, "https": proxy}, timeout=max_response_time)
+        response = http_client.get(test_url, proxies={"http": proxy, "https": proxy}, timeout=max_response_time)
         response_time = time.time() - start_time
         if response.status_code == 200 and response_time <= max_response_time:
             return proxy, response_time
@@ -109,13 +118,15 @@ def test_proxy(proxy):
         return proxy, float('inf')  # Return the proxy and infinity response time on exception
     return proxy, float('inf')  # Return the proxy and infinity response time if no exception
 
-def get_fastest_proxies(proxies_list):
+def get_fastest_proxies_threaded(proxies_list):
     with ThreadPoolExecutor(max_workers=max_threads) as executor:
         future_to_proxy = {executor.submit(test_proxy, proxy): proxy for proxy in proxies_list}
         results = []
         for future in as_completed(future_to_proxy):
             proxy, response_time = future.result()
-            if response_time != float('inf') and response_time <= max_response_time:
+            ok = response_time != float('inf') and response_time <= max_response_time
+            proxy_tracker.record(proxy, ok, response_time if ok else None)
+            if ok:
                 results.append((proxy, response_time))
 
     results.sort(key=lambda x: x[1])
@@ -124,4 +135,100 @@ def get_fastest_proxies(proxies_list):
 
     redis_client.setex(redis_key, 7200, json.dumps(fastest_proxies))
 
-    return fastest_proxies
\ No newline at end of file
+    return fastest_proxies
+
+
+# Maximum number of concurrent asyncio probes, before the open-files limit is applied
+max_concurrent_probes = 2000
+
+# File descriptors left for everything else in the process (Redis, AMQP, HTTP pools, logs)
+fd_headroom = 256
+
+# Errors raised by this host running out of resources; they say nothing about the proxy
+LOCAL_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM, errno.EADDRNOTAVAIL}
+
+def probe_concurrency(requested=max_concurrent_probes, headroom=fd_headroom):
+    """`requested`, clamped so the probes' sockets fit under the soft RLIMIT_NOFILE."""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - headroom))
+
+# Deadline for a whole validation run, in seconds
+validation_deadline = 30
+
+# Probe results are written to Redis in batches of this size as they arrive
+result_flush_size = 100
+
+def proxy_url(proxy):
+    return proxy if '://' in proxy else f"http://{proxy}"
+
+async def test_proxy_async(session, proxy, semaphore):
+    async with semaphore:
+        start_time = time.monotonic()
+        try:
+            async with session.get(test_url, proxy=proxy_url(proxy), timeout=aiohttp.ClientTimeout(total=max_response_time)) as response:
+                await response.read()
+                response_time = time.monotonic() - start_time
+                if response.status == 200 and response_time <= max_response_time:
+                    return proxy, response_time
+        except OSError as e:
+            # aiohttp's connection errors are OSErrors carrying the errno of the failed socket call
+            if e.errno in LOCAL_ERRNOS:
+                logging.warning(f"Proxy probe failed locally, not counted against {proxy}: {e}")
+                return proxy, None
+        except Exception:
+            pass
+        return proxy, float('inf')
+
+async def validate_proxies(proxies_list, concurrency=None, deadline=validation_deadline):
+    """
+    Probe every proxy concurrently on one event loop.
+
+    Results are streamed into the proxy health ranking in batches while the
+    run is in progress. Probes still pending at `deadline` count as failed,
+    and probes that failed for local reasons (e.g. EMFILE) are not recorded.
+    Concurrency defaults to max_concurrent_probes, clamped to the open-files
+    limit.
+    """
+    concurrency = probe_concurrency(concurrency or max_concurrent_probes)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=True)
+    results = []
+    pending = []
+
+    def flush():
+        proxy_tracker.record_many(pending)
+        pending.clear()
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [asyncio.ensure_future(test_proxy_async(session, proxy, semaphore)) for proxy in proxies_list]
+        try:
+            for next_result in asyncio.as_completed(tasks, timeout=deadline):
+                proxy, response_time = await next_result
+                if response_time is None:
+                    continue
+                ok = response_time != float('inf')
+                pending.append((proxy, ok, response_time if ok else None))
+                if ok:
+                    results.append((proxy, response_time))
+                if len(pending) >= result_flush_size:
+                    flush()
+        except asyncio.TimeoutError:
+            logging.warning(f"Proxy validation deadline reached with {sum(not t.done() for t in tasks)} probes pending")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    flush()
+    return results
+
+def get_fastest_proxies(proxies_list):
+    results = asyncio.run(validate_proxies(proxies_list))
+
+    results.sort(key=lambda x: x[1])
+
+    fastest_proxies = [proxy for proxy, _ in results]
+
+    redis_client.setex(redis_key, 7200, json.dumps(fastest_proxies))
+
+    return fastest_proxies
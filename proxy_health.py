@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import redis_client, PROXY_HEALTH_ALPHA, PROXY_SAMPLE_BATCH, PROXY_SAMPLE_INTERVAL
+from metrics import metrics
+
+# Fold one observation into a proxy's EWMA latency and success rate, then
+# rescore it in the ranking set. Failures count as a slow sample so a proxy
+# that keeps timing out sinks even if its rare successes are fast.
+RECORD_SCRIPT = """
+local alpha = tonumber(ARGV[1])
+local ok = tonumber(ARGV[2])
+local latency = tonumber(ARGV[3])
+local now = ARGV[4]
+
+local state = redis.call('HMGET', KEYS[1], 'latency', 'success', 'samples')
+local ewma_latency = tonumber(state[1])
+local ewma_success = tonumber(state[2])
+local samples = tonumber(state[3]) or 0
+if ewma_latency == nil then
+    ewma_latency = latency
+    ewma_success = ok
+else
+    ewma_latency = alpha * latency + (1 - alpha) * ewma_latency
+    ewma_success = alpha * ok + (1 - alpha) * ewma_success
+end
+
+redis.call('HSET', KEYS[1], 'latency', ewma_latency, 'success', ewma_success, 'samples', samples + 1, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 86400)
+redis.call('ZADD', KEYS[2], ewma_latency / math.max(ewma_success, 0.01), ARGV[5])
+return tostring(ewma_latency)
+"""
+
+
+class ProxyHealthTracker:
+    """
+    Keeps an always-warm ranking of proxies in the `proxy_health` sorted set.
+
+    Scores are EWMA latency divided by EWMA success rate (lower is better).
+    They are fed by real request outcomes (`record`) and by a background
+    sampler that probes a small batch of proxies per tick, so nobody waits on
+    a full sweep. Workers share a cursor in Redis to split the sampling.
+    """
+
+    def __init__(self, alpha=PROXY_HEALTH_ALPHA, batch=PROXY_SAMPLE_BATCH, interval=PROXY_SAMPLE_INTERVAL,
+                 ranking_key='proxy_health', failure_latency=10):
+        self.alpha = alpha
+        self.batch = batch
+        self.interval = interval
+        self.ranking_key = ranking_key
+        self.failure_latency = failure_latency
+        self._script = redis_client.register_script(RECORD_SCRIPT)
+        self._sampler = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def record(self, proxy, ok, latency=None):
+        """Fold one observed outcome for `proxy` into its health stats."""
+        metrics.inc('proxy_requests_total', result='success' if ok else 'failure')
+        if not ok or latency is None:
+            latency = self.failure_latency
+        try:
+            self._script(keys=[f"proxy:health:{proxy}", self.ranking_key],
+                         args=[self.alpha, 1 if ok else 0, latency, time.time(), proxy])
+        except Exception as e:
+            logging.error(f"Error recording proxy health for {proxy}: {e}")
+
+    def record_many(self, outcomes):
+        """Record (proxy, ok, latency) outcomes in one pipelined round-trip."""
+        if not outcomes:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for proxy, ok, latency in outcomes:
+                metrics.inc('proxy_requests_total', result='success' if ok else 'failure')
+                if not ok or latency is None:
+                    latency = self.failure_latency
+                self._script(keys=[f"proxy:health:{proxy}", self.ranking_key],
+                             args=[self.alpha, 1 if ok else 0, latency, time.time(), proxy], client=pipe)
+            pipe.execute()
+        except Exception as e:
+            logging.error(f"Error recording proxy health batch: {e}")
+
+    def ranked(self, limit=100, max_score=None):
+        """Best proxies first (all of them when `limit` is None); `max_score` drops slower/flakier ones."""
+        if max_score is None:
+            members = redis_client.zrange(self.ranking_key, 0, (limit or 0) - 1)
+        else:
+            members = redis_client.zrangebyscore(self.ranking_key, '-inf', max_score, start=0, num=limit or -1)
+        return [member.decode('utf-8') for member in members]
+
+    def health(self, proxy):
+        state = redis_client.hgetall(f"proxy:health:{proxy}")
+        return {key.decode('utf-8'): float(value) for key, value in state.items()}
+
+    def sample(self, proxies_list):
+        """Probe the next batch of proxies in `proxies_list` and record the results."""
+        from proxies import test_proxy
+
+        if not proxies_list:
+            return
+        start = redis_client.incrby('proxy_health:cursor', self.batch) - self.batch
+        batch = [proxies_list[(start + i) % len(proxies_list)] for i in range(min(self.batch, len(proxies_list)))]
+        with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+            for proxy, response_time in executor.map(test_proxy, batch):
+                ok = response_time != float('inf')
+                self.record(proxy, ok, response_time if ok else None)
+
+    def prune(self, proxies_list):
+        """Drop ranked proxies that are no longer in the source list."""
+        current = set(proxies_list)
+        stale = [member for member in self.ranked(limit=None) if member not in current]
+        if stale:
+            redis_client.zrem(self.ranking_key, *stale)
+
+    def kick(self):
+        """Ask the sampler to run a round now instead of waiting for the next tick."""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._sampler is not None:
+            return
+        with self._lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="ProxyHealthSampler", daemon=True)
+                self._sampler.start()
+
+    def _run(self):
+        from proxies import fetch_proxies
+
+        last_prune = 0
+        while True:
+            try:
+                proxies_list = fetch_proxies() or []
+                if time.time() - last_prune > 600:
+                    self.prune(proxies_list)
+                    last_prune = time.time()
+                self.sample(proxies_list)
+            except Exception as e:
+                logging.error(f"Proxy health sampler error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+proxy_tracker = ProxyHealthTracker()
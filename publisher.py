@@ -0,0 +1,98 @@
+import os
+import threading
+import logging
+import time
+
+import pika
+from config import params, PUBLISHER_CONFIRMS, PUBLISHER_MAX_RETRIES
+
+
+class Publisher:
+    """
+    Long-lived AMQP publisher.
+
+    One connection and channel per process, shared by every thread under a
+    lock, since pika's BlockingConnection is not thread-safe. Short-lived
+    threads (background /scan runs, ingest flushes) therefore reuse it
+    instead of each leaving a connection open behind them. Queues are
+    declared once per channel and the connection is rebuilt on failure.
+    """
+
+    def __init__(self, parameters=params, confirm=PUBLISHER_CONFIRMS, max_retries=PUBLISHER_MAX_RETRIES):
+        self.parameters = parameters
+        self.confirm = confirm
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+        self._open_channel = None
+        self._declared = set()
+
+    def _channel(self):
+        """The process's channel, (re)connected if needed. Call with the lock held."""
+        if self._pid != os.getpid():
+            # Connections must not be shared across a fork (gunicorn workers)
+            self._pid = os.getpid()
+            self._connection = None
+            self._open_channel = None
+        if self._connection is None or self._connection.is_closed or self._open_channel is None or self._open_channel.is_closed:
+            self._close()
+            self._connection = pika.BlockingConnection(self.parameters)
+            self._open_channel = self._connection.channel()
+            if self.confirm:
+                self._open_channel.confirm_delivery()
+            self._declared = set()
+            logging.debug("Publisher connected to RabbitMQ")
+        else:
+            # Service heartbeats that arrived while the connection sat idle
+            self._connection.process_data_events(time_limit=0)
+        return self._open_channel
+
+    def _close(self):
+        """Call with the lock held."""
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._open_channel = None
+
+    def publish(self, queue, bodies, properties=None):
+        """
+        Publish a batch of message bodies to `queue` over the process's channel.
+
+        `properties` applies to every message, or may be a list with one
+        entry per body.
+        """
+        bodies = list(bodies)
+        if not isinstance(properties, (list, tuple)):
+            properties = [properties] * len(bodies)
+        sent = 0
+        for attempt in range(self.max_retries):
+            with self._lock:
+                try:
+                    channel = self._channel()
+                    if queue not in self._declared:
+                        channel.queue_declare(queue=queue)
+                        self._declared.add(queue)
+                    while sent < len(bodies):
+                        channel.basic_publish(exchange='', routing_key=queue, body=bodies[sent], properties=properties[sent])
+                        sent += 1
+                    return sent
+                except pika.exceptions.UnroutableError as e:
+                    logging.error(f"Message to {queue} was returned by the broker: {e}")
+                    sent += 1
+                    continue
+                except pika.exceptions.AMQPError as e:
+                    logging.error(f"Error publishing to {queue}, reconnecting: {e}")
+                    self._close()
+            # Back off without holding the lock, so other threads aren't stalled behind it
+            time.sleep(min(2 ** attempt, 5))
+        raise pika.exceptions.AMQPConnectionError(f"Failed to publish to {queue} after {self.max_retries} attempts")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+publisher = Publisher()
@@ -1,14 +1,22 @@
 
-from config import redis_client
+from config import redis_client, SCRAPE_HEDGED, HEDGE_DEFAULT_DELAY, POCKETBASE_URL, REDDIT_API_URL
+import dedup
+from code_loader import load_function
 from fetcher import get_proxy_from_cache,fetch_api_endpoints,get_tags
 from proxies import get_fastest_proxies,fetch_proxies
 
 import redis
 import requests
+import http_client
 import json
 import logging
 import urllib.parse
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import defaultdict, deque
+import time
+from proxy_health import proxy_tracker
 
 # Set up logging
 logging.basicConfig(filename='reddit_scraper.log', level=logging.INFO)
@@ -25,6 +33,7 @@ default_agent = {
     "post_types": ["hot"],
     "url_json_object": {},
     "max_selftext_words": 500,
+    "comment_fanout": 5,  # concurrent comment fetches per listing
     "timeframes": ["hour", "day", "week"]  # ["hour", "day", "week", "month", "year", "all"]
 }
 
@@ -37,6 +46,11 @@ with open(path, 'r') as file:
 
 def get_fast_proxies():
     try:
+        proxy_tracker.start()
+        ranked = proxy_tracker.ranked()
+        if ranked:
+            return ranked
+        # Cold start: nothing sampled yet
         p = redis_client.get("fastest_proxies")
         if p is None:
             proxies_list = fetch_proxies()
@@ -55,10 +69,131 @@ def get_fast_proxies():
         print(f"Unexpected error: {e}")
         return []
 
-def scrape_url(proxies, user_agents, url, last_working_proxy=None, max_retries=30):
+# Per-attempt timeout for proxied Reddit requests
+request_timeout = 10
+
+hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+attempt_latencies = defaultdict(lambda: deque(maxlen=200))  # successful attempt latencies per host
+scrape_latencies = deque(maxlen=1000)  # end-to-end scrape_url durations
+
+def scrape_url(proxies, user_agents, url, last_working_proxy=None, max_retries=30, hedged=SCRAPE_HEDGED):
     """
     Scrape a URL using a rotating proxy and user agent.
 
+    Args:
+        proxies (list): List of proxy URLs
+        user_agents (list): List of user agent strings
+        url (str): URL to scrape
+        last_working_proxy (str, optional): Last working proxy, if any
+        max_retries (int, optional): Maximum number of retries for a single proxy
+        hedged (bool, optional): Race a backup proxy instead of trying proxies strictly in turn
+
+    Returns:
+        response_text (str): HTML response text
+        last_working_proxy (str): Last working proxy
+    """
+    start_time = time.time()
+    try:
+        if hedged:
+            return hedged_scrape_url(proxies, user_agents, url, last_working_proxy, max_retries)
+        return scrape_url_sequential(proxies, user_agents, url, last_working_proxy, max_retries)
+    finally:
+        scrape_latencies.append(time.time() - start_time)
+
+def scrape_latency_stats():
+    """p50/p99 of recent scrape_url durations, in seconds."""
+    samples = sorted(scrape_latencies)
+    if not samples:
+        return {'count': 0, 'p50': None, 'p99': None}
+    return {
+        'count': len(samples),
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+def hedge_delay(host):
+    """p90 of recent successful attempt latencies to `host`, clamped to [0.2s, request_timeout]."""
+    samples = sorted(attempt_latencies[host])
+    if len(samples) < 10:
+        return HEDGE_DEFAULT_DELAY
+    return min(max(samples[int(len(samples) * 0.9)], 0.2), request_timeout)
+
+def get_sticky_proxy(host):
+    proxy = redis_client.get(f"proxy:sticky:{host}")
+    return proxy.decode('utf-8') if proxy else None
+
+def try_proxy(url, proxy, user_agents, stop=None):
+    """
+    One attempt through `proxy`; returns (data, latency) or (None, None).
+
+    Once `stop` is set the attempt is abandoned: it is not started, or its
+    response is dropped if another attempt won while it was in flight.
+    """
+    if stop is not None and stop.is_set():
+        return None, None
+    headers = {'User-Agent': random.choice(user_agents)}
+    start_time = time.time()
+    try:
+        response = http_client.get(url, proxies={'http': proxy, 'https': proxy}, headers=headers, timeout=request_timeout)
+        if response.status_code == 200:
+            latency = time.time() - start_time
+            proxy_tracker.record(proxy, True, latency)
+            if stop is not None and stop.is_set():
+                return None, None
+            return response.json(), latency
+        proxy_tracker.record(proxy, False)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.warning(f"Error with proxy {proxy}: {e}")
+        proxy_tracker.record(proxy, False)
+    return None, None
+
+def hedged_scrape_url(proxies, user_agents, url, last_working_proxy=None, max_attempts=30):
+    """
+    Send the request through the best proxy and, if it hasn't answered
+    after the host's p90 latency, race a backup through the next one.
+
+    At most two attempts are in flight and at most `max_attempts` proxies
+    are tried; a failed attempt is replaced right away. Once one attempt
+    succeeds the others are cancelled, or told to stop if already running.
+    The winning proxy is remembered per host and tried first next time.
+    """
+    host = urllib.parse.urlparse(url).netloc
+    sticky = last_working_proxy or get_sticky_proxy(host)
+    order = (([sticky] if sticky in proxies else []) + [proxy for proxy in proxies if proxy != sticky])[:max_attempts]
+    delay = hedge_delay(host)
+    stop = threading.Event()
+    pending = {}
+    next_index = 0
+
+    try:
+        while pending or next_index < len(order):
+            if next_index < len(order) and len(pending) < 2:
+                future = hedge_executor.submit(try_proxy, url, order[next_index], user_agents, stop)
+                pending[future] = order[next_index]
+                next_index += 1
+            done, _ = wait(pending, timeout=delay if next_index < len(order) else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                proxy = pending.pop(future)
+                data, latency = future.result()
+                if data is not None:
+                    logging.info(f"Successful request with proxy {proxy}")
+                    attempt_latencies[host].append(latency)
+                    if proxy != sticky:
+                        redis_client.setex(f"proxy:sticky:{host}", 3600, proxy)
+                    return data, proxy
+    finally:
+        stop.set()
+        for future in pending:
+            future.cancel()
+
+    logging.error(f"Failed to scrape URL with any of {len(order)} proxies")
+    proxy_tracker.kick()
+    return None, None
+
+def scrape_url_sequential(proxies, user_agents, url, last_working_proxy=None, max_retries=30):
+    """
+    Scrape a URL using a rotating proxy and user agent, one proxy at a time.
+
     Args:
         proxies (list): List of proxy URLs
         user_agents (list): List of user agent strings
@@ -82,29 +217,34 @@ def scrape_url(proxies, user_agents, url, last_working_proxy=None, max_retries=3
         headers = {'User-Agent': user_agent}
         print(headers)
         try:
-            response = requests.get(url, proxies={'http': proxy, 'https': proxy}, headers=headers, timeout=10)
+            start_time = time.time()
+            response = http_client.get(url, proxies={'http': proxy, 'https': proxy}, headers=headers, timeout=request_timeout)
             if response.status_code == 200:
                 logging.info(f"Successful request with proxy {proxy}")
                 data = response.json()
+                proxy_tracker.record(proxy, True, time.time() - start_time)
                 
                 return data, proxy
+            proxy_tracker.record(proxy, False)
+            retries += 1
         except requests.exceptions.RequestException as e:
             logging.warning(f"Error with proxy {proxy}: {e}")
+            proxy_tracker.record(proxy, False)
             retries += 1
         proxy_index = (proxy_index + 1) % len(proxies)
 
     logging.error(f"Failed to scrape URL after {max_retries} attempts")
-    proxies_list = fetch_proxies()
-    get_fastest_proxies(proxies_list)
+    # Failures above already demoted these proxies; refresh the ranking in the background
+    proxy_tracker.kick()
     
     return None, None
 
 
 #last_working=None
-def fetch_comments(post, user_agents, proxies, agent):
+def fetch_comments(post, user_agents, proxies, agent, start_proxy=None):
     """Fetch comments for a post using the scrape_url function."""
-    comments_url = f"https://oauth.reddit.com/r/{post['subreddit']}/comments/{post['id']}/.json"
-    response_text, last_working_ = scrape_url(proxies, user_agents, comments_url)
+    comments_url = f"{REDDIT_API_URL}/r/{post['subreddit']}/comments/{post['id']}/.json"
+    response_text, last_working_ = scrape_url(proxies, user_agents, comments_url, last_working_proxy=start_proxy)
     #last_working = last_working_
 
     if response_text:
@@ -127,6 +267,28 @@ def fetch_comments(post, user_agents, proxies, agent):
         return comments
     return []
 
+def fetch_comments_concurrently(comment_jobs, agent):
+    """
+    Fetch comments for (post_data, reddit_data) pairs with up to agent["comment_fanout"] requests in flight.
+
+    Each job starts from a different proxy of the ranked pool so concurrent
+    requests don't pile onto the same proxy.
+    """
+    if not comment_jobs:
+        return
+    proxies_list = get_fast_proxies()
+
+    def fetch(job_index):
+        post_data, reddit_data = comment_jobs[job_index]
+        start_proxy = proxies_list[job_index % len(proxies_list)] if proxies_list else None
+        try:
+            reddit_data["comments"] = fetch_comments(post_data, user_agents, proxies_list, agent, start_proxy)
+        except Exception as e:
+            logging.error(f"Error fetching comments for {post_data.get('name')}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, agent.get("comment_fanout", 5))) as executor:
+        list(executor.map(fetch, range(len(comment_jobs))))
+
 def create_reddit_api_url(json_obj):
     """
     Create a dynamic URL to fetch data from the Reddit API.
@@ -159,7 +321,7 @@ def create_reddit_api_url(json_obj):
     default_params = merged_json_obj.get("default_params",{})
 
     # Construct the base URL
-    base_url = f"https://oauth.reddit.com/r/{subreddit}/{sort}.json"
+    base_url = f"{REDDIT_API_URL}/r/{subreddit}/{sort}.json"
     # Initialize the params dictionary with limit, sort, and t parameters
     params = {
         "limit": limit,
@@ -186,6 +348,55 @@ def create_reddit_api_url(json_obj):
 
     return url
 
+def select_listing_posts(children, processed, agent):
+    """
+    Filter a Reddit listing down to the posts worth keeping.
+
+    Args:
+        children (list): data.children of the listing
+        processed (set): processed:<name> keys already flagged in Redis
+        agent (dict): Agent configuration with the thresholds
+
+    Returns:
+        posts (list): Kept posts, in listing order
+        comment_jobs (list): (post_data, reddit_data) pairs whose comments should be fetched
+        newly_processed (list): processed:<name> keys to flag
+    """
+    posts = []
+    comment_jobs = []
+    newly_processed = []
+    for post in children:
+        post_data = post["data"]
+        logging.debug(post_data["title"])
+        word_count = len(post_data["selftext"].split())
+        if word_count > agent["max_selftext_words"] or post_data["num_comments"] >= agent['min_comments'] or post_data["ups"] >= agent['min_ups'] or post_data["score"] >= agent['min_score']:
+            processed_key = f"processed:{post_data['name']}"
+            # Check Redis for a processed flag
+            if processed_key in processed:
+                print(f"Post {post_data['name']} already processed.")
+                continue
+            reddit_data = {
+                "id": post_data["id"],
+                "name": post_data["name"],
+                "title": post_data["title"],
+                "author": post_data["author"],
+                "created_utc": post_data["created_utc"],
+                "subreddit": post_data["subreddit"],
+                "content": post_data["selftext"],
+                "num_comments": post_data["num_comments"],
+                "ups": post_data["ups"],
+                "score": post_data["score"],
+                "link_flair_text": post_data["link_flair_text"],
+                "url": post_data["url"],
+                "permalink": post_data["permalink"],
+                "comments": []
+            }
+            if word_count <= agent["max_selftext_words"] or post_data["num_comments"] >= agent['min_comments']:
+                comment_jobs.append((post_data, reddit_data))
+            posts.append(reddit_data)
+            newly_processed.append(processed_key)
+    return posts, comment_jobs, newly_processed
+
 def fetch_subreddit_posts(agent=None):
     """Fetch subreddit posts for all specified post types."""
     if agent is None:
@@ -227,45 +438,18 @@ def fetch_subreddit_posts(agent=None):
                 data = response_text
                 print(f'Data received from Reddit for {post_type} with timeframe {timeframe}')
                 print(len(data["data"]["children"]))
-                for post in data["data"]["children"]:
-                    post_data = post["data"]
-                    print(post_data["title"])
-                    if  len(post_data["selftext"].split()) > agent["max_selftext_words"] or post_data["num_comments"] >= agent['min_comments'] or post_data["ups"] >= agent['min_ups'] or post_data["score"] >= agent['min_score']:
-                        reddit_data = {
-                            "id": post_data["id"],
-                            "name": post_data["name"],
-                            "title": post_data["title"],
-                            "author": post_data["author"],
-                            "created_utc": post_data["created_utc"],
-                            "subreddit": post_data["subreddit"],
-                            "content": post_data["selftext"],
-                            "num_comments": post_data["num_comments"],
-                            "ups": post_data["ups"],
-                            "score": post_data["score"],
-                            "link_flair_text": post_data["link_flair_text"],
-                            "url": post_data["url"],
-                            "permalink": post_data["permalink"],
-                            "comments": []
-                        }
-                        # Check Redis for a processed flag
-                        if redis_client.exists(f"processed:{post_data['name']}"):
-                            print(f"Post {post_data['name']} already processed.")
-                        else:
-                            word_count = len(post_data["selftext"].split())
-                            if word_count <= agent["max_selftext_words"] or post_data["num_comments"] >= agent['min_comments']:
-                                    #if post_data["num_comments"] >= agent['min_comments_to_cache']:
-                                    comment_proxies_list = get_fast_proxies()
-                                    reddit_data["comments"] = fetch_comments(post_data, user_agents, comment_proxies_list, agent)
-
-                                    all_posts.append(reddit_data)
-                                    # Set processed flag in Redis
-                                    redis_client.setex(f"processed:{post_data['name']}", agent['cache_expirations'], "1")
-                                    found_posts = True
-                            else:
-                                all_posts.append(reddit_data)
-                                # Set processed flag in Redis
-                                redis_client.setex(f"processed:{post_data['name']}", agent['cache_expirations'], "1")
-                                found_posts = True
+                # Check and set the processed flags for the whole listing in one round-trip each
+                processed = dedup.seen(f"processed:{post['data']['name']}" for post in data["data"]["children"])
+                posts, comment_jobs, newly_processed = select_listing_posts(data["data"]["children"], processed, agent)
+                all_posts.extend(posts)
+                if posts:
+                    found_posts = True
+
+                # Comments are filled in after the listing pass, so all_posts keeps listing order
+                fetch_comments_concurrently(comment_jobs, agent)
+
+                # Set processed flags in Redis
+                dedup.mark(newly_processed, agent['cache_expirations'], "1")
 
                 # If we have found unprocessed posts, break the loop to avoid fetching for longer timeframes
                 if found_posts:
@@ -277,9 +461,8 @@ def fetch_subreddit_posts(agent=None):
 
 
 def execute_code(params, comments_params, code):
-    local_vars = {}
-    exec(code, globals(), local_vars)
-    return local_vars['fetch_reddit_data'](params, comments_params)
+    fetch_reddit_data = load_function(code, 'fetch_reddit_data', globals())
+    return fetch_reddit_data(params, comments_params)
 
 def join_list_or_list_of_lists(input_list):
     if not isinstance(input_list, list):
@@ -309,8 +492,7 @@ def fetch_pullpush_results(agent):
     if agent["fetch_pullpush"]:
         try:
             sub = agent['subreddit']
-            BASE_URL_ = "https://stories-blog.pockethost.io"
-            m = get_tags([sub], BASE_URL_)
+            m = get_tags([sub])
             q = join_list_or_list_of_lists(m[0])
             params = {
                 "q": q,
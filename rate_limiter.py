@@ -0,0 +1,162 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import redis
+from config import redis_client, LLM_RATE_LIMITS, LLM_PROVIDER_CONCURRENCY
+
+# Two token buckets (requests and tokens per minute) refilled continuously,
+# plus the shared back-off deadline set after a 429 (KEYS[3]).
+# Returns "0" when both had room and were charged, else the seconds to wait.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local blocked_until = tonumber(redis.call('GET', KEYS[3]) or 0)
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+
+local function level(key, capacity)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    return math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60)
+end
+
+local requests = level(KEYS[1], rpm)
+local wait = 0
+if requests < 1 then
+    wait = (1 - requests) * 60 / rpm
+end
+local tokens = 0
+if tpm > 0 then
+    cost = math.min(cost, tpm)
+    tokens = level(KEYS[2], tpm)
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) * 60 / tpm)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', requests - 1, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+if tpm > 0 then
+    redis.call('HSET', KEYS[2], 'tokens', tokens - cost, 'ts', now)
+    redis.call('EXPIRE', KEYS[2], 120)
+end
+return "0"
+"""
+
+# Move the back-off deadline forward (never back) and let it expire with it.
+BLOCK_SCRIPT = """
+local until_ = tonumber(ARGV[1])
+local current = tonumber(redis.call('GET', KEYS[1]) or 0)
+if until_ > current then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', math.ceil((until_ - tonumber(ARGV[2])) * 1000))
+end
+return 1
+"""
+
+
+def estimate_tokens(*texts, max_tokens=0):
+    """Rough prompt+completion token count (~4 characters per token)."""
+    return sum(len(text or '') for text in texts) // 4 + max_tokens
+
+
+class RateLimiter:
+    """
+    Redis-backed token buckets shared by every worker and node.
+
+    When Redis says a bucket is empty, the wait time is remembered locally so
+    other threads of this process sleep without asking Redis again. A
+    provider back-off (block) is stored in Redis, so every process waits it out.
+    """
+
+    def __init__(self, limits=LLM_RATE_LIMITS, prefix='ratelimit'):
+        self.limits = limits
+        self.prefix = prefix
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._block_script = redis_client.register_script(BLOCK_SCRIPT)
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _limit(self, provider, model):
+        return self.limits.get(f"{provider}:{model}") or self.limits.get(provider)
+
+    def _wait_locally(self, key):
+        with self._lock:
+            delay = self._blocked_until.get(key, 0) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _blocked_key(self, key):
+        return f"{self.prefix}:{key}:blocked"
+
+    def _block_locally(self, key, seconds):
+        with self._lock:
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0), time.time() + seconds)
+
+    def block(self, provider, model, seconds):
+        """Hold back every caller of a bucket, in all processes, e.g. after the provider answered 429."""
+        key = f"{provider}:{model}"
+        self._block_locally(key, seconds)
+        now = time.time()
+        try:
+            self._block_script(keys=[self._blocked_key(key)], args=[now + seconds, now])
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Rate limiter unavailable, back-off for {key} is local only: {e}")
+
+    def _wait_shared_block(self, key):
+        """Sleep out a back-off set by any process; used when no bucket is configured."""
+        try:
+            blocked_until = float(redis_client.get(self._blocked_key(key)) or 0)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Rate limiter unavailable, not throttling {key}: {e}")
+            return
+        if blocked_until > time.time():
+            self._block_locally(key, blocked_until - time.time())
+            self._wait_locally(key)
+
+    def acquire(self, provider, model, tokens=0):
+        """Block until one request and `tokens` tokens are available for provider/model."""
+        limit = self._limit(provider, model)
+        key = f"{provider}:{model}"
+        if not limit:
+            self._wait_locally(key)
+            self._wait_shared_block(key)
+            return
+        redis_keys = [f"{self.prefix}:{key}:requests", f"{self.prefix}:{key}:tokens", self._blocked_key(key)]
+        while True:
+            self._wait_locally(key)
+            try:
+                wait = float(self._script(keys=redis_keys, args=[time.time(), limit.get('rpm', 0) or 1e9, limit.get('tpm', 0), tokens]))
+            except redis.exceptions.RedisError as e:
+                logging.error(f"Rate limiter unavailable, not throttling {key}: {e}")
+                return
+            if wait <= 0:
+                return
+            self._block_locally(key, wait)
+
+
+rate_limiter = RateLimiter()
+
+_provider_slots = {
+    provider: threading.BoundedSemaphore(limit) for provider, limit in LLM_PROVIDER_CONCURRENCY.items()
+}
+
+
+@contextmanager
+def provider_slot(provider):
+    """Cap the number of in-flight requests to an LLM provider from this process."""
+    slot = _provider_slots.get(provider)
+    if slot is None:
+        yield
+        return
+    with slot:
+        yield
@@ -0,0 +1,88 @@
+import threading
+from collections import defaultdict
+
+from config import REDIS_CACHE_EXPIRATION, POCKETBASE_URL
+from fetcher import fetch_and_cache
+
+CONTROLLERS_URL = f"{POCKETBASE_URL}/api/collections/scraper_controllers/records"
+
+
+class ControllerRegistry:
+    """
+    Indexed view over every record of the scraper_controllers collection.
+
+    Pages are read through fetch_and_cache, so the indexes are rebuilt only
+    when one of the cached pages is refreshed, not on every lookup.
+    """
+
+    def __init__(self, url=CONTROLLERS_URL, per_page=200, cache_expiration=REDIS_CACHE_EXPIRATION):
+        self.url = url
+        self.per_page = per_page
+        self.cache_expiration = cache_expiration
+        self._lock = threading.Lock()
+        self._pages = None
+        self._items = []
+        self._by_id = {}
+        self._by_source = {}
+        self._by_author = {}
+
+    def _fetch_pages(self):
+        first = fetch_and_cache(f"{self.url}?page=1&perPage={self.per_page}", self.cache_expiration)
+        if not first:
+            return ()
+        pages = [first]
+        for page in range(2, (first.get('totalPages') or 1) + 1):
+            data = fetch_and_cache(f"{self.url}?page={page}&perPage={self.per_page}", self.cache_expiration)
+            if data:
+                pages.append(data)
+        return tuple(pages)
+
+    def _refresh(self):
+        pages = self._fetch_pages()
+        with self._lock:
+            # The cache hands back the same decoded objects until it reloads a page
+            if self._pages is not None and len(pages) == len(self._pages) and all(a is b for a, b in zip(pages, self._pages)):
+                return
+            items = [item for page in pages for item in page.get('items', [])]
+            by_source = defaultdict(list)
+            by_author = defaultdict(list)
+            for item in items:
+                by_source[item.get('source')].append(item)
+                by_author[item.get('author_id')].append(item)
+            self._items = items
+            self._by_id = {item.get('id'): item for item in items}
+            self._by_source = dict(by_source)
+            self._by_author = dict(by_author)
+            self._pages = pages
+
+    def all(self):
+        self._refresh()
+        return list(self._items)
+
+    def get(self, controller_id):
+        self._refresh()
+        return self._by_id.get(controller_id)
+
+    def by_source(self, source):
+        self._refresh()
+        return list(self._by_source.get(source, []))
+
+    def by_author(self, author_id):
+        self._refresh()
+        return list(self._by_author.get(author_id, []))
+
+    def find(self, key, value):
+        """First controller whose `key` equals `value`; indexed for id, source and author_id."""
+        if key == 'id':
+            return self.get(value)
+        if key == 'source':
+            matches = self.by_source(value)
+        elif key == 'author_id':
+            matches = self.by_author(value)
+        else:
+            self._refresh()
+            matches = [item for item in self._items if item.get(key) == value]
+        return matches[0] if matches else None
+
+
+controller_registry = ControllerRegistry()
@@ -0,0 +1,173 @@
+import json
+import time
+import random
+import logging
+import threading
+import urllib.parse
+from collections import defaultdict
+
+import http_client
+from config import redis_client, POCKETBASE_URL, TAG_INDEX_PAGES, TAG_INDEX_INTERVAL
+
+BASE_URL = POCKETBASE_URL
+
+
+class TagIndex:
+    """
+    Tag co-occurrence index shared by all workers through Redis.
+
+    A periodic job reads the tags of the most recent articles and stores,
+    for every tag, the set of tag lists it appeared in
+    (`tags:index:<tag>`), plus the set of all indexed tags. A lookup matches
+    every indexed tag that contains one of the requested tags, as the old
+    PocketBase `tags ?~ "<tag>"` filter did, and samples those sets with one
+    pipelined SRANDMEMBER round trip, so there is no HTTP call on the hot
+    path. The index is rebuilt once per interval by whichever worker takes
+    the build lock, or sooner when a lookup finds nothing.
+    """
+
+    kick_interval = 60  # minimum seconds between rebuilds asked for by kick()
+    names_ttl = 60  # seconds the list of indexed tags is kept in process
+    max_matches = 50  # indexed tags sampled for one requested tag
+
+    def __init__(self, base_url=BASE_URL, pages=TAG_INDEX_PAGES, per_page=200, interval=TAG_INDEX_INTERVAL,
+                 prefix='tags:index'):
+        self.base_url = base_url
+        self.pages = pages
+        self.per_page = per_page
+        self.interval = interval
+        self.prefix = prefix
+        self._builder = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._names = []
+        self._names_at = 0.0
+
+    @staticmethod
+    def _normalize(tag):
+        return str(tag).strip().lower()
+
+    def _key(self, tag):
+        return f"{self.prefix}:{self._normalize(tag)}"
+
+    def fetch_recent_tag_lists(self):
+        url = f"{self.base_url}/api/collections/view_articles_list/records"
+        tag_lists = []
+        for page in range(1, self.pages + 1):
+            params = {"page": page, "perPage": self.per_page, "sort": "-created", "fields": "tags"}
+            response = http_client.get(f"{url}?{urllib.parse.urlencode(params)}")
+            if response.status_code != 200:
+                logging.error(f"Error fetching tags page {page}: {response.status_code}")
+                break
+            json_obj = response.json()
+            for item in json_obj.get("items", []):
+                tags = item.get("tags") or []
+                if isinstance(tags, str):
+                    tags = [tag.strip() for tag in tags.split(',')]
+                tags = [tag for tag in tags if isinstance(tag, str) and tag.strip()]
+                if tags:
+                    tag_lists.append(tags)
+            if page >= json_obj.get("totalPages", page):
+                break
+        return tag_lists
+
+    def build(self):
+        """Rebuild the index from recent articles; returns the number of tags indexed."""
+        index = defaultdict(set)
+        for tags in self.fetch_recent_tag_lists():
+            member = json.dumps(tags)
+            for tag in tags:
+                index[self._normalize(tag)].add(member)
+        # Keys of tags that stop appearing simply expire
+        pipe = redis_client.pipeline(transaction=True)
+        if index:
+            for name, members in index.items():
+                key = self._key(name)
+                pipe.delete(key)
+                pipe.sadd(key, *members)
+                pipe.expire(key, self.interval * 3)
+            pipe.delete(f"{self.prefix}:tags")
+            pipe.sadd(f"{self.prefix}:tags", *index)
+            pipe.expire(f"{self.prefix}:tags", self.interval * 3)
+        # Recorded even when nothing was found, so an empty index is not rebuilt on every kick
+        pipe.set(f"{self.prefix}:built", int(time.time()), ex=self.interval * 3)
+        pipe.execute()
+        logging.info(f"Tag index rebuilt with {len(index)} tags")
+        return len(index)
+
+    def indexed_tags(self):
+        """All indexed tags, refreshed from Redis every `names_ttl` seconds."""
+        now = time.monotonic()
+        if now - self._names_at > self.names_ttl:
+            self._names = sorted(name.decode('utf-8') for name in redis_client.smembers(f"{self.prefix}:tags"))
+            self._names_at = now
+        return self._names
+
+    def matching_tags(self, tags):
+        """Indexed tags containing any of `tags`, case-insensitively (at most `max_matches` per tag)."""
+        names = self.indexed_tags()
+        matches = set()
+        for tag in tags:
+            needle = self._normalize(tag)
+            if not needle:
+                continue
+            found = [name for name in names if needle in name]
+            if len(found) > self.max_matches:
+                found = random.sample(found, self.max_matches)
+            matches.update(found)
+        return matches
+
+    def sample(self, tags, count=2):
+        """Up to `count` random tag lists with a tag containing any of `tags`, or [[tags]] if none match."""
+        matches = self.matching_tags(tags)
+        members = set()
+        if matches:
+            pipe = redis_client.pipeline(transaction=False)
+            for name in matches:
+                pipe.srandmember(self._key(name), count)
+            for result in pipe.execute():
+                members.update(result or [])
+        if not members:
+            self.kick()
+            return [[tags]]  # return default pass tags if nothing is indexed
+        picked = random.sample(sorted(members), min(count, len(members)))
+        return [json.loads(member) for member in picked]
+
+    def kick(self):
+        """Ask the builder to rebuild now, unless the index was built in the last `kick_interval` seconds."""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._builder is not None:
+            return
+        with self._lock:
+            if self._builder is None:
+                self._builder = threading.Thread(target=self._run, name="TagIndexBuilder", daemon=True)
+                self._builder.start()
+
+    def _due(self, kicked):
+        built = redis_client.get(f"{self.prefix}:built")
+        if built is None:
+            return True
+        age = time.time() - int(built)
+        return age >= (self.kick_interval if kicked else self.interval)
+
+    def _run(self):
+        kicked = False
+        while True:
+            try:
+                # The lock only guards a build in progress and is released right after,
+                # so a kick from another worker is not blocked for a whole interval
+                if self._due(kicked) and redis_client.set(f"{self.prefix}:lock", 1, nx=True, ex=300):
+                    try:
+                        self.build()
+                        self._names_at = 0.0
+                    finally:
+                        redis_client.delete(f"{self.prefix}:lock")
+            except Exception as e:
+                logging.error(f"Tag index build failed: {e}")
+            kicked = self._wake.wait(self.interval)
+            self._wake.clear()
+
+tag_index = TagIndex()
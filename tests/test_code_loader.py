@@ -0,0 +1,21 @@
+import json
+import re
+
+from code_loader import compile_lambda
+
+
+class Response:
+    text = '{"proxies": ["1.2.3.4:8080", "5.6.7.8:3128"]}'
+
+
+def test_lambda_uses_caller_globals():
+    extract = compile_lambda("json.loads(response.text)['proxies']", globals())
+    assert extract(Response()) == ['1.2.3.4:8080', '5.6.7.8:3128']
+
+
+def test_lambda_is_cached_per_namespace():
+    expression = "re.findall(r'\\d+\\.\\d+\\.\\d+\\.\\d+', response.text)"
+    extract = compile_lambda(expression, globals())
+    assert compile_lambda(expression, globals()) is extract
+    assert compile_lambda(expression, {'re': re}) is not extract
+    assert extract(Response()) == ['1.2.3.4', '5.6.7.8']
@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.bench_json_utils import legacy_extract_json_data, legacy_terminates, llm_outputs, property_check
+from json_utils import extract_json_data
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_matches_legacy_on_adversarial_inputs(seed):
+    # Raises on the first input where the two implementations disagree
+    assert property_check(20000, seed) > 10000
+
+
+@pytest.mark.parametrize('data', ['}{', '][ ', '{', '[', 'a } b {', '] [1] [', '{"a": 1} {', '[1] [2] ['])
+def test_inputs_that_hung_legacy(data):
+    assert not legacy_terminates(data)
+    result = extract_json_data(data)
+    assert isinstance(result, (dict, list))
+
+
+@pytest.mark.parametrize('data, expected', [
+    ('}{', {}),
+    ('][ ', {}),
+    ('{"a": 1} {', {'a': 1}),
+    ('x [1, 2] [', [1, 2]),
+    ('text {"title": "t"} more {', {'title': 't'}),
+])
+def test_trailing_open_bracket(data, expected):
+    # The value ending at the last closing bracket is still found
+    assert extract_json_data(data) == expected
+
+
+def test_llm_outputs_match_legacy():
+    for name, data in llm_outputs(50).items():
+        assert extract_json_data(data) == legacy_extract_json_data(data), name
+
+
+def test_extracts_object_after_stray_braces():
+    data = 'Here is the {result}: {"title": "A", "tags": ["x", "y"]}'
+    assert extract_json_data(data) == {'title': 'A', 'tags': ['x', 'y']}
+
+
+def test_fenced_block_wins():
+    data = 'Sure!\n```json\n{"summary": "s"}\n```\n{"other": 1}'
+    assert extract_json_data(data) == {'summary': 's'}
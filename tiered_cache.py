@@ -0,0 +1,147 @@
+import time
+import fnmatch
+import logging
+import threading
+from collections import OrderedDict
+
+from config import redis_client, LOCAL_CACHE_MAXSIZE, LOCAL_CACHE_TTL, LOCAL_CACHE_STALE_TTL, CACHE_INVALIDATION_CHANNEL
+from metrics import metrics
+
+
+class TieredCache:
+    """
+    In-process LRU/TTL cache of decoded values, meant to sit in front of Redis.
+
+    - Fresh entries are returned without touching Redis.
+    - Stale entries (older than ttl but within stale_ttl) are returned at once
+      while a single background thread refreshes them.
+    - Misses are single-flight: one thread runs the loader per key, the
+      others wait for its result.
+    - Keys are dropped when a glob pattern is published on the invalidation
+      channel (see config.flush_keys_containing_pattern).
+    - Every lookup is counted in cache_requests_total under `tier`, as a hit
+      when a cached (fresh or stale) value was returned and as a miss otherwise.
+    """
+
+    def __init__(self, maxsize=LOCAL_CACHE_MAXSIZE, ttl=LOCAL_CACHE_TTL, stale_ttl=LOCAL_CACHE_STALE_TTL,
+                 channel=CACHE_INVALIDATION_CHANNEL, tier='local'):
+        self.maxsize = maxsize
+        self.tier = tier
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.channel = channel
+        self._entries = OrderedDict()  # key -> (value, loaded_at, ttl)
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self._listener = None
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'invalidations': 0}
+
+    def get(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling `loader()` to fill it. None results are not cached."""
+        self._ensure_listener()
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at, entry_ttl = entry
+                age = time.time() - loaded_at
+                if age < entry_ttl:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    metrics.inc('cache_requests_total', tier=self.tier, result='hit')
+                    return value
+                if age < entry_ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.counters['stale_hits'] += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = threading.Event()
+                        threading.Thread(target=self._load, args=(key, loader, ttl), daemon=True).start()
+                    metrics.inc('cache_requests_total', tier=self.tier, result='hit')
+                    return value
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                self.counters['misses'] += 1
+                event = self._inflight[key] = threading.Event()
+        # Waiting for another thread's load is a miss too: nothing usable was cached
+        metrics.inc('cache_requests_total', tier=self.tier, result='miss')
+        if leader:
+            return self._load(key, loader, ttl)
+        event.wait()
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def _load(self, key, loader, ttl):
+        value = None
+        try:
+            value = loader()
+        except Exception as e:
+            logging.error(f"Error loading cache key {key}: {e}")
+            with self._lock:
+                self.counters['load_errors'] += 1
+        with self._lock:
+            self.counters['loads'] += 1
+            if value is not None:
+                self._entries[key] = (value, time.time(), ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+        if value is None:
+            with self._lock:
+                entry = self._entries.get(key)
+            return entry[0] if entry else None
+        return value
+
+    def invalidate(self, pattern='*'):
+        """Drop local entries whose key matches the glob `pattern`."""
+        with self._lock:
+            if pattern == '*':
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+                dropped = len(keys)
+                for key in keys:
+                    del self._entries[key]
+            self.counters['invalidations'] += dropped
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _ensure_listener(self):
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="CacheInvalidationListener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    pattern = message.get('data')
+                    if isinstance(pattern, bytes):
+                        pattern = pattern.decode('utf-8')
+                    if pattern:
+                        self.invalidate(pattern)
+                        logging.debug(f"Invalidated local cache entries matching {pattern}")
+            except Exception as e:
+                logging.error(f"Cache invalidation listener error: {e}")
+                # Anything could have been flushed while we were disconnected
+                self.invalidate('*')
+                time.sleep(5)
+
+
+local_cache = TieredCache()
@@ -0,0 +1,108 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+import pika
+from config import redis_client, TRACE_TTL, TRACE_KEEP
+
+
+class Tracer:
+    """
+    Per-article stage tracing across the scraper and LLM queues.
+
+    A trace is a small dict: an id, the time the work was first enqueued, the
+    time of the last mark and the seconds spent in each stage so far. It is
+    carried in the AMQP 'trace' header and in the scraped record, and each
+    stage calls mark() when it finishes, so a stage's span runs from the end
+    of the previous one (queue waits included). Finished traces are kept in
+    Redis and ranked by end-to-end latency.
+    """
+
+    def __init__(self, ttl=TRACE_TTL, keep=TRACE_KEEP, prefix='trace'):
+        self.ttl = ttl
+        self.keep = keep
+        self.prefix = prefix
+        self.ranking_key = f"{prefix}:slowest"
+        self._local = threading.local()
+
+    def new(self, parent=None):
+        """Start a trace, inheriting the start time and stages of `parent` (e.g. the scrape job)."""
+        now = time.time()
+        if parent:
+            return {'id': uuid.uuid4().hex, 'started': parent['started'], 'last': parent['last'], 'stages': dict(parent['stages'])}
+        return {'id': uuid.uuid4().hex, 'started': now, 'last': now, 'stages': {}}
+
+    def mark(self, trace, stage):
+        """Close `stage` on `trace`: the time since the previous mark is added to it."""
+        if trace is None:
+            return None
+        now = time.time()
+        trace['stages'][stage] = trace['stages'].get(stage, 0) + now - trace['last']
+        trace['last'] = now
+        return trace
+
+    def finish(self, trace, status='ok', **meta):
+        """Store a finished trace and rank it by end-to-end latency."""
+        if trace is None:
+            return
+        total = trace['last'] - trace['started']
+        record = {**trace, 'status': status, 'total': total, **meta}
+        logging.info(f"Trace {trace['id']} {status} in {total:.1f}s: "
+                     + ', '.join(f"{stage}={seconds:.1f}s" for stage, seconds in trace['stages'].items()))
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.setex(f"{self.prefix}:{trace['id']}", self.ttl, json.dumps(record))
+            pipe.zadd(self.ranking_key, {trace['id']: total})
+            pipe.zremrangebyrank(self.ranking_key, 0, -(self.keep + 1))
+            pipe.expire(self.ranking_key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logging.error(f"Error storing trace {trace['id']}: {e}")
+
+    def slowest(self, count=20):
+        """The `count` slowest finished traces, each with its per-stage breakdown."""
+        trace_ids = [trace_id.decode('utf-8') if isinstance(trace_id, bytes) else trace_id
+                     for trace_id in redis_client.zrevrange(self.ranking_key, 0, count - 1)]
+        if not trace_ids:
+            return []
+        records = redis_client.mget([f"{self.prefix}:{trace_id}" for trace_id in trace_ids])
+        expired = [trace_id for trace_id, record in zip(trace_ids, records) if record is None]
+        if expired:
+            redis_client.zrem(self.ranking_key, *expired)
+        return [json.loads(record) for record in records if record is not None]
+
+    def properties(self, trace):
+        """AMQP properties carrying `trace`, or None when there is nothing to carry."""
+        if trace is None:
+            return None
+        return pika.BasicProperties(headers={'trace': json.dumps(trace)})
+
+    def from_properties(self, properties):
+        headers = getattr(properties, 'headers', None) or {}
+        trace = headers.get('trace')
+        if isinstance(trace, bytes):
+            trace = trace.decode('utf-8')
+        try:
+            return json.loads(trace) if trace else None
+        except ValueError:
+            logging.error(f"Ignoring malformed trace header: {trace}")
+            return None
+
+    def current(self):
+        """Trace of the message the calling thread is handling, if any."""
+        return getattr(self._local, 'trace', None)
+
+    @contextmanager
+    def activate(self, trace):
+        previous = self.current()
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = previous
+
+
+tracer = Tracer()